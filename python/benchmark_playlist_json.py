@@ -0,0 +1,137 @@
+"""
+compare the two /api/playlist/info response paths on a synthetic playlist:
+  models - a PlaylistVideoInfo per entry, returned through response_model=PlaylistInfoResponse
+  fast   - the plain-dict records and FastJSONResponse the endpoint uses now
+
+usage: python benchmark_playlist_json.py [--entries 5000] [--runs 5]
+no network access is needed, playlist extraction is replaced with generated entries
+"""
+import argparse
+import statistics
+import sys
+import time
+import tracemalloc
+from typing import List
+
+from fastapi.testclient import TestClient
+
+import server
+from server import PlaylistInfoRequest, PlaylistInfoResponse, PlaylistVideoInfo, format_duration
+
+def make_entries(count: int) -> List[dict]:
+    """roughly what yt-dlp's flat extraction returns per playlist entry"""
+    entries = []
+    for i in range(count):
+        video_id = f"vid{i:08d}"
+        entries.append({
+            '_type': 'url',
+            'ie_key': 'Youtube',
+            'id': video_id,
+            'url': f"https://www.youtube.com/watch?v={video_id}",
+            'title': f"Example video number {i} with a reasonably long title",
+            'description': None,
+            'duration': 60 + i % 3600,
+            'channel_id': 'UCexamplechannel000000',
+            'channel': 'Example Channel',
+            'uploader': 'Example Channel',
+            'thumbnail': f"https://i.ytimg.com/vi/{video_id}/hqdefault.jpg",
+            'thumbnails': [
+                {'url': f"https://i.ytimg.com/vi/{video_id}/{name}.jpg", 'height': h, 'width': w}
+                for name, w, h in (('default', 120, 90), ('mqdefault', 320, 180), ('hqdefault', 480, 360))
+            ],
+            'view_count': i * 37,
+            'live_status': None,
+        })
+    return entries
+
+def process_playlist_entries(entries: List[dict], include_formats: bool = False) -> List[PlaylistVideoInfo]:
+    # the previous implementation, one validated model per entry
+    videos = []
+    for i, entry in enumerate(entries):
+        try:
+            video_id = entry.get('id', '')
+            duration = entry.get('duration', 0)
+            videos.append(PlaylistVideoInfo(
+                video_id=video_id,
+                title=entry.get('title', f'Video {i+1}'),
+                duration=duration,
+                duration_string=format_duration(duration),
+                thumbnail=entry.get('thumbnail'),
+                uploader=entry.get('uploader', entry.get('channel', 'Unknown')),
+                index=i,
+                url=f"https://www.youtube.com/watch?v={video_id}",
+                video_formats=[],
+                audio_formats=[]
+            ))
+        except Exception:
+            continue
+    return videos
+
+def install_model_route():
+    @server.app.post("/bench/playlist/info-models", response_model=PlaylistInfoResponse)
+    async def playlist_info_models(request: PlaylistInfoRequest):
+        info = await server.extract_playlist_info_with_fallback(request.url, request.max_videos, request.include_formats)
+        videos = process_playlist_entries(info['entries'], request.include_formats)
+        return PlaylistInfoResponse(
+            playlist_title=info['title'],
+            playlist_id=info['id'],
+            uploader=info['uploader'],
+            total_videos=info['playlist_count'],
+            extracted_videos=len(videos),
+            videos=videos
+        )
+
+def measure(client: TestClient, path: str, body: dict, runs: int) -> dict:
+    client.post(path, json=body)  # warm up
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        response = client.post(path, json=body)
+        timings.append(time.perf_counter() - start)
+        response.raise_for_status()
+
+    tracemalloc.start()
+    response = client.post(path, json=body)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        "median_ms": statistics.median(timings) * 1000,
+        "best_ms": min(timings) * 1000,
+        "peak_mb": peak / (1024 * 1024),
+        "bytes": len(response.content),
+        "payload": response.json(),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--entries", type=int, default=5000)
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    entries = make_entries(args.entries)
+
+    async def fake_extract(url, max_videos=50, include_formats=False):
+        return {'title': 'Benchmark playlist', 'id': 'PLbenchmark', 'uploader': 'Example Channel',
+                'playlist_count': len(entries), 'entries': entries}
+
+    server.extract_playlist_info_with_fallback = fake_extract
+    install_model_route()
+    body = {"url": "https://www.youtube.com/playlist?list=PLbenchmark", "max_videos": args.entries}
+
+    with TestClient(server.app) as client:
+        models = measure(client, "/bench/playlist/info-models", body, args.runs)
+        fast = measure(client, "/api/playlist/info", body, args.runs)
+
+    if models.pop("payload") != fast.pop("payload"):
+        print("responses differ between the two paths")
+        sys.exit(1)
+
+    encoder = "orjson" if server.orjson is not None else "json (install orjson for the faster encoder)"
+    print(f"{args.entries} entries, {args.runs} runs, fast path encoder: {encoder}")
+    for name, result in (("models", models), ("fast", fast)):
+        print(f"  {name:<7} median {result['median_ms']:8.1f} ms   best {result['best_ms']:8.1f} ms   "
+              f"peak {result['peak_mb']:6.1f} MB   {result['bytes'] / 1024:8.0f} KB")
+    print(f"  speedup {models['median_ms'] / fast['median_ms']:.1f}x")
+
+if __name__ == "__main__":
+    main()
@@ -6,28 +6,49 @@ if sys.platform == "win32":
     sys.stderr = io.TextIOWrapper(sys.stderr.buffer, encoding='utf-8', errors='replace')
 
 from fastapi import FastAPI, HTTPException, Request, Depends, BackgroundTasks
-from fastapi.responses import FileResponse, JSONResponse, HTMLResponse
+from fastapi.responses import FileResponse, JSONResponse, HTMLResponse, Response
 from fastapi.openapi.docs import get_swagger_ui_html
-from pydantic import BaseModel, field_validator
+from pydantic import BaseModel, ValidationError, ValidationInfo, field_validator
 import yt_dlp
 from yt_dlp.utils import download_range_func
+from yt_dlp.cookies import YoutubeDLCookieJar
 import uuid
 import re
-from typing import List, Optional, Union
+from typing import Callable, List, Optional, Union
 import time
 import os
 import asyncio
 import json
+import math
+import mimetypes
 import zipfile
 from pathlib import Path
+from urllib.parse import urlparse
 from datetime import datetime
-from contextlib import asynccontextmanager
+from email.utils import formatdate
+from contextlib import asynccontextmanager, contextmanager
 
 import platform
+import random
 import tempfile
 import subprocess
+import shutil
+import socket
+import sqlite3
+import threading
+import contextvars
+import traceback
+import weakref
+from array import array
+from collections import deque
 from concurrent.futures import ThreadPoolExecutor
 
+# optional, see requirements.txt; the stdlib encoder is used without it
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 # app config directory
 APP_CONFIG_DIR = ".config/app-data-7c4f"
 
@@ -111,6 +132,14 @@ def set_downloads_directory(new_path):
 def get_cookies_directory():
     return Path.home() / ".config" / "app-data-7c4f" / "cookies"
 
+def get_archives_directory():
+    """download archives for playlist sync, one json file per playlist id"""
+    return Path.home() / APP_CONFIG_DIR / "archives"
+
+def get_ydl_cache_directory():
+    """persistent yt-dlp cache (player js, signature functions) so it survives restarts"""
+    return Path.home() / APP_CONFIG_DIR / "yt-dlp-cache"
+
 def detect_ffmpeg_path():
     script_dir = Path(__file__).parent.absolute()
     potential_paths = []
@@ -151,14 +180,27 @@ def detect_deno_path():
                 return str(path)
     return None
 
+def detect_ffprobe_path(ffmpeg_path: Optional[str]):
+    """ffprobe ships next to the bundled ffmpeg, fall back to whatever is on PATH"""
+    if ffmpeg_path:
+        name = "ffprobe.exe" if platform.system() == "Windows" else "ffprobe"
+        path = Path(ffmpeg_path).parent / name
+        if path.exists() and path.is_file():
+            return str(path)
+    return shutil.which("ffprobe")
+
 COOKIES_DIR = get_cookies_directory()
 COOKIES_DIR.mkdir(parents=True, exist_ok=True)
 
+YDL_CACHE_DIR = get_ydl_cache_directory()
+YDL_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+
 # make sure default download folder exists
 get_downloads_directory()
 
 FFMPEG_PATH = detect_ffmpeg_path()
 DENO_PATH = detect_deno_path()
+FFPROBE_PATH = detect_ffprobe_path(FFMPEG_PATH)
 
 if FFMPEG_PATH:
     ffmpeg_dir = str(Path(FFMPEG_PATH).parent)
@@ -167,15 +209,188 @@ if FFMPEG_PATH:
         path_separator = ';' if platform.system() == 'Windows' else ':'
         os.environ['PATH'] = f"{ffmpeg_dir}{path_separator}{current_path}"
 
-executor = ThreadPoolExecutor(max_workers=4)
+# PERFORMANCE TUNABLES
+# (low, high) bounds for each tunable, a PATCH outside them is rejected
+PERFORMANCE_LIMITS = {
+    "executor_workers": (1, 32),
+    "transcode_workers": (1, 32),
+    "concurrent_fragment_downloads": (1, 16),
+    "retries": (0, 20),
+    "extractor_retries": (0, 20),
+    "fragment_retries": (0, 50),
+    "throttle_retries": (0, 10),
+    "upstream_max_concurrency": (1, 32),
+    "batch_max_videos": (1, 200),
+    "playlist_default_videos": (1, 1000),
+    "playlist_max_videos": (1, 1000),
+    "player_code_cache_size": (1, 20),
+    "player_result_cache_size": (100, 100000),
+    "ydl_pool_max_idle": (0, 128),
+    "storyboard_cache_max_videos": (1, 10000),
+    "waveform_cache_max_videos": (1, 100000),
+}
+
+class PerformanceSettings(BaseModel):
+    """speed vs upstream pressure, memory and disk, stored under "performance" in settings.json"""
+    executor_workers: int = 4  # yt-dlp calls, merges, cuts and other blocking work
+    # one per core, clamped so big hosts still pass validation when a PATCH re-checks every field
+    transcode_workers: int = min(os.cpu_count() or 2, PERFORMANCE_LIMITS["transcode_workers"][1])
+    concurrent_fragment_downloads: int = 1  # per dash/hls download
+    retries: int = 1
+    extractor_retries: int = 1
+    fragment_retries: int = 2
+    throttle_retries: int = 2  # extra attempts after a throttled request, see _run_with_cookie_health
+    upstream_max_concurrency: int = 8  # ceiling for the AIMD limiters
+    batch_max_videos: int = 20
+    playlist_default_videos: int = 50  # when a request doesn't say how many
+    playlist_max_videos: int = 100
+    player_code_cache_size: int = 3  # player js builds are a few MB each
+    player_result_cache_size: int = 5000
+    ydl_pool_max_idle: int = 16
+    storyboard_cache_max_videos: int = 200
+    waveform_cache_max_videos: int = 1000  # a few hundred KB per hour of audio
+    
+    @field_validator('*')
+    @classmethod
+    def validate_limits(cls, v, info: ValidationInfo):
+        low, high = PERFORMANCE_LIMITS[info.field_name]
+        if v < low or v > high:
+            raise ValueError(f'{info.field_name} must be between {low} and {high}')
+        if info.field_name == 'playlist_max_videos' and v < info.data.get('playlist_default_videos', 0):
+            raise ValueError('playlist_max_videos must not be below playlist_default_videos')
+        return v
+
+def load_performance_settings() -> PerformanceSettings:
+    stored = load_settings().get("performance") or {}
+    try:
+        return PerformanceSettings(**{k: v for k, v in stored.items() if k in PerformanceSettings.model_fields})
+    except ValidationError as e:
+        print(f"ignoring invalid performance settings: {e}")
+        return PerformanceSettings()
+
+def save_performance_settings(tunables: PerformanceSettings) -> bool:
+    settings = load_settings()
+    settings["performance"] = tunables.model_dump()
+    return save_settings(settings)
+
+# read at use time everywhere, PATCH /api/settings/performance swaps it
+performance = load_performance_settings()
+
+executor = ThreadPoolExecutor(max_workers=performance.executor_workers)
 active_downloads = {}
+
+# EVENT LOOP LAG MONITOR
+LOOP_LAG_INTERVAL = 0.1  # seconds between heartbeat ticks
+LOOP_STALL_THRESHOLD_MS = float(os.environ.get("CLIPLY_LOOP_STALL_MS", "250"))
+LOOP_DEBUG = os.environ.get("CLIPLY_LOOP_DEBUG", "").lower() in ("1", "true", "yes")
+
+class LoopLagMonitor:
+    """measure how late the event loop wakes up, optionally capture stacks of whatever is holding it"""
+    def __init__(self, interval: float = LOOP_LAG_INTERVAL, stall_threshold_ms: float = LOOP_STALL_THRESHOLD_MS, debug: bool = LOOP_DEBUG):
+        self.interval = interval
+        self.stall_threshold_ms = stall_threshold_ms
+        self.debug = debug
+        self.samples = deque(maxlen=600)
+        self.stalls = deque(maxlen=20)
+        self.max_lag_ms = 0.0
+        self.stall_count = 0
+        self._heartbeat = time.monotonic()
+        self._loop_thread_id = None
+        self._task = None
+        self._watchdog = None
+        self._stop = threading.Event()
+    
+    def start(self):
+        self._loop_thread_id = threading.get_ident()
+        self._heartbeat = time.monotonic()
+        self._stop.clear()
+        self._task = asyncio.get_event_loop().create_task(self._tick())
+        # the watchdog thread is cheap when idle, so it always runs and only captures in debug mode
+        self._watchdog = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self._watchdog.start()
+    
+    async def stop(self):
+        self._stop.set()
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+    
+    async def _tick(self):
+        while True:
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            lag_ms = max(0.0, (now - expected) * 1000)
+            self._heartbeat = now
+            self.samples.append(lag_ms)
+            self.max_lag_ms = max(self.max_lag_ms, lag_ms)
+            if lag_ms >= self.stall_threshold_ms:
+                self.stall_count += 1
+                if self.stalls and self.stalls[-1].get("ongoing"):
+                    self.stalls[-1]["ongoing"] = False
+                    self.stalls[-1]["duration_ms"] = round(lag_ms, 1)
+    
+    def _watch(self):
+        captured_for = None
+        while not self._stop.wait(self.interval):
+            beat = self._heartbeat
+            held_ms = (time.monotonic() - beat - self.interval) * 1000
+            if held_ms < self.stall_threshold_ms:
+                continue
+            if not self.debug or captured_for == beat:
+                continue
+            # one stack per stall, taken while the loop is still blocked
+            captured_for = beat
+            frame = sys._current_frames().get(self._loop_thread_id)
+            if frame is None:
+                continue
+            self.stalls.append({
+                "detected_at": datetime.now().isoformat(timespec='seconds'),
+                "held_ms": round(held_ms, 1),
+                "ongoing": True,
+                "stack": traceback.format_stack(frame)[-15:]
+            })
+    
+    def snapshot(self) -> dict:
+        samples = sorted(self.samples)
+        def percentile(p):
+            if not samples:
+                return 0.0
+            return round(samples[min(len(samples) - 1, int(len(samples) * p))], 1)
+        return {
+            "current_lag_ms": round(self.samples[-1], 1) if self.samples else 0.0,
+            "p50_lag_ms": percentile(0.5),
+            "p99_lag_ms": percentile(0.99),
+            "max_lag_ms": round(self.max_lag_ms, 1),
+            "stall_threshold_ms": self.stall_threshold_ms,
+            "stall_count": self.stall_count,
+            "debug": self.debug,
+            "stalls": list(self.stalls) if self.debug else []
+        }
+
+loop_monitor = LoopLagMonitor()
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
+    loop_monitor.start()
     cookie_manager.ensure_cookie_file()
+    cookie_watch_task = asyncio.create_task(cookie_manager.watch())
     if cookie_manager.has_valid_cookies():
         await cookie_manager.test_cookies()
+    # warm in the background so startup isn't held up by extractor init or the player fetch
+    asyncio.get_event_loop().run_in_executor(executor, ydl_pool.warm, get_enhanced_ydl_opts())
+    warmup_task = asyncio.create_task(warm_player_js_cache())
     yield
+    warmup_task.cancel()
+    cookie_watch_task.cancel()
+    await loop_monitor.stop()
     executor.shutdown(wait=True)
+    transcode_executor.shutdown(wait=True)
+    ydl_pool.close()
+    cookie_manager.save_jars()
 
 app = FastAPI(
     title="Cliply API Server", 
@@ -185,10 +400,114 @@ app = FastAPI(
     lifespan=lifespan
 )
 
+# substrings of yt-dlp errors that mean youtube is challenging this client/identity
+BOT_DETECTION_MARKERS = (
+    "Sign in to confirm",
+    "confirm you're not a bot",
+    "HTTP Error 429",
+)
+
+COOKIE_COOLDOWN_BASE = 300  # seconds an identity sits out after its first bot-detection hit
+COOKIE_COOLDOWN_MAX = 6 * 3600
+COOKIE_REFRESH_INTERVAL = 5  # seconds between checks for added, removed or edited cookie files
+
+def is_bot_detection_error(error_msg: str) -> bool:
+    return any(marker in error_msg for marker in BOT_DETECTION_MARKERS)
+
+class CookieIdentity:
+    """one cookie file, its parsed jar and its health"""
+    def __init__(self, path: Path):
+        self.path = path
+        self.jar = None
+        self.cookie_count = 0
+        self.mtime = None
+        self.saved_state = None
+        self.successes = 0
+        self.failures = 0
+        self.strikes = 0
+        self.cooldown_until = 0.0
+        self.last_used = 0.0
+    
+    def refresh(self):
+        """re-parse the cookie file only if it changed since the last load"""
+        try:
+            stat = self.path.stat()
+        except OSError:
+            self.jar, self.cookie_count, self.mtime = None, 0, None
+            return
+        mtime = (stat.st_mtime_ns, stat.st_size)
+        if mtime == self.mtime:
+            return
+        try:
+            jar = YoutubeDLCookieJar(str(self.path))
+            jar.load()
+            self.jar = jar
+            self.cookie_count = len(jar)
+            self.saved_state = self.jar_state()
+        except Exception as e:
+            print(f"failed to load cookies from {self.path.name}: {e}")
+            self.jar, self.cookie_count = None, 0
+        self.mtime = mtime
+    
+    def jar_state(self) -> frozenset:
+        return frozenset((c.domain, c.path, c.name, c.value, c.expires) for c in self.jar)
+    
+    def save(self):
+        """write cookies youtube rotated during the session back to the file
+        
+        pooled instances share the jar without a cookiefile param, so yt-dlp never does this itself.
+        """
+        if self.jar is None:
+            return
+        try:
+            stat = self.path.stat()
+        except OSError:
+            return
+        # the file was replaced since we loaded it, the new one wins over our copy
+        if (stat.st_mtime_ns, stat.st_size) != self.mtime:
+            return
+        if self.jar_state() == self.saved_state:
+            return
+        tmp_path = self.path.with_name(self.path.name + ".tmp")
+        self.jar.save(str(tmp_path))
+        os.replace(tmp_path, self.path)
+        # our own write must not look like an external edit to refresh()
+        stat = self.path.stat()
+        self.mtime = (stat.st_mtime_ns, stat.st_size)
+        self.saved_state = self.jar_state()
+        self.cookie_count = len(self.jar)
+    
+    @property
+    def cooling_down(self) -> bool:
+        return time.monotonic() < self.cooldown_until
+    
+    def status(self) -> dict:
+        return {
+            "name": self.path.name,
+            "cookies": self.cookie_count,
+            "healthy": not self.cooling_down,
+            "strikes": self.strikes,
+            "cooldown_remaining": max(0, int(self.cooldown_until - time.monotonic())),
+            "successes": self.successes,
+            "failures": self.failures
+        }
+
 class CookieManager:
+    """keeps parsed cookie jars in memory and spreads jobs across a pool of cookie files
+    
+    the pool is youtube_cookies.txt plus any youtube_cookies_*.txt in the cookies directory.
+    identities that hit bot detection sit out for an exponentially growing cooldown.
+    """
     def __init__(self):
         self.cookie_file = COOKIES_DIR / "youtube_cookies.txt"
+        self.identities = {}
+        self._dir_mtime = None
+        # _lock only guards in-memory state and is safe to take on the event loop,
+        # file i/o happens under _refresh_lock, off the loop
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
         self.ensure_cookie_file()
+        self.refresh()
         
     def ensure_cookie_file(self):
         if not self.cookie_file.exists():
@@ -196,14 +515,88 @@ class CookieManager:
                 f.write("# Netscape HTTP Cookie File\n")
                 f.write("# This is a generated file! Do not edit.\n\n")
     
+    def refresh(self):
+        """pick up added, removed and edited cookie files; blocking, runs off the event loop"""
+        with self._refresh_lock:
+            try:
+                dir_mtime = COOKIES_DIR.stat().st_mtime_ns
+            except OSError:
+                dir_mtime = None
+            identities = self.identities
+            # adding or removing a cookie file bumps the directory mtime
+            if dir_mtime != self._dir_mtime:
+                paths = [self.cookie_file] + sorted(COOKIES_DIR.glob("youtube_cookies_*.txt"))
+                identities = {str(path): identities.get(str(path)) or CookieIdentity(path) for path in paths}
+            for identity in identities.values():
+                identity.refresh()
+            with self._lock:
+                self.identities = identities
+                self._dir_mtime = dir_mtime
+    
+    async def watch(self):
+        loop = asyncio.get_event_loop()
+        while True:
+            await asyncio.sleep(COOKIE_REFRESH_INTERVAL)
+            try:
+                await loop.run_in_executor(None, self.refresh)
+            except Exception as e:
+                print(f"failed to refresh cookie files: {e}")
+    
+    def _usable(self) -> List[CookieIdentity]:
+        return [identity for identity in self.identities.values() if identity.cookie_count > 0]
+    
     def has_valid_cookies(self) -> bool:
-        try:
-            with open(self.cookie_file, 'r') as f:
-                content = f.read().strip()
-                lines = [line for line in content.split('\n') if line and not line.startswith('#')]
-                return len(lines) > 0
-        except:
-            return False
+        return len(self._usable()) > 0
+    
+    def select_cookiefile(self) -> Optional[str]:
+        """pick the least recently used healthy identity, or the one closest to recovering"""
+        usable = self._usable()
+        if not usable:
+            return None
+        with self._lock:
+            healthy = [identity for identity in usable if not identity.cooling_down]
+            if healthy:
+                identity = min(healthy, key=lambda i: i.last_used)
+            else:
+                identity = min(usable, key=lambda i: i.cooldown_until)
+            identity.last_used = time.monotonic()
+            return str(identity.path)
+    
+    def get_jar(self, cookiefile: str):
+        """in-memory jar for a pool cookie file, None if it isn't one we manage"""
+        identity = self.identities.get(cookiefile)
+        return identity.jar if identity is not None else None
+    
+    def save_jars(self):
+        with self._refresh_lock:
+            for identity in self.identities.values():
+                try:
+                    identity.save()
+                except Exception as e:
+                    print(f"failed to save cookies to {identity.path.name}: {e}")
+    
+    def report_success(self, cookiefile: Optional[str]):
+        identity = self.identities.get(cookiefile) if cookiefile else None
+        if identity is None:
+            return
+        with self._lock:
+            identity.successes += 1
+            identity.strikes = 0
+    
+    def report_failure(self, cookiefile: Optional[str], error_msg: str):
+        identity = self.identities.get(cookiefile) if cookiefile else None
+        if identity is None or not is_bot_detection_error(error_msg):
+            return
+        with self._lock:
+            identity.failures += 1
+            identity.strikes += 1
+            cooldown = min(COOKIE_COOLDOWN_BASE * 2 ** (identity.strikes - 1), COOKIE_COOLDOWN_MAX)
+            identity.cooldown_until = time.monotonic() + cooldown
+        print(f"cookie identity {identity.path.name} hit bot detection, resting for {cooldown}s")
+    
+    def status(self) -> List[dict]:
+        self.refresh()
+        return [identity.status() for identity in self.identities.values()]
     
     async def test_cookies(self) -> bool:
         try:
@@ -211,7 +604,7 @@ class CookieManager:
             ydl_opts = {
                 'quiet': True,
                 'no_warnings': True,
-                'cookiefile': str(self.cookie_file) if self.has_valid_cookies() else None,
+                'cookiefile': self.select_cookiefile(),
                 'extract_flat': True,
             }
             info = await extract_info_async(test_url, ydl_opts)
@@ -254,6 +647,7 @@ class TimeRange(BaseModel):
 
 class VideoInfoRequest(BaseModel):
     url: str
+    time_range: Optional[TimeRange] = None  # scale size estimates to this range
     
     @field_validator('url')
     @classmethod
@@ -285,16 +679,40 @@ class CombinedDownloadRequest(BaseModel):
     audio_format_id: str
     time_range: Optional[TimeRange] = None
     precise_cut: bool = False
+    smart_cut: bool = False  # with precise_cut, re-encode only the GOPs at the cut edges
+
+# target codec -> output extension and ffmpeg encoder args for audio conversion
+AUDIO_TARGET_CODECS = {
+    "mp3": {"ext": "mp3", "codec_name": "mp3", "args": ['-c:a', 'libmp3lame', '-q:a', '2']},
+    "opus": {"ext": "opus", "codec_name": "opus", "args": ['-c:a', 'libopus', '-b:a', '160k']},
+    "aac": {"ext": "m4a", "codec_name": "aac", "args": ['-c:a', 'aac', '-b:a', '192k']},
+    "flac": {"ext": "flac", "codec_name": "flac", "args": ['-c:a', 'flac']},
+    "wav": {"ext": "wav", "codec_name": "pcm_s16le", "args": ['-c:a', 'pcm_s16le']},
+}
+
+def validate_target_codec(v: Optional[str]) -> Optional[str]:
+    if v is None:
+        return v
+    v = v.lower()
+    if v not in AUDIO_TARGET_CODECS:
+        raise ValueError(f"Unsupported audio codec: {v}. Use one of {', '.join(AUDIO_TARGET_CODECS)}")
+    return v
 
 class AudioDownloadRequest(BaseModel):
     url: str
     format_id: str
     time_range: Optional[TimeRange] = None
     precise_cut: bool = False
+    target_codec: Optional[str] = None  # convert after download, e.g. mp3 or opus
+    
+    @field_validator('target_codec')
+    @classmethod
+    def validate_codec(cls, v):
+        return validate_target_codec(v)
 
 class PlaylistInfoRequest(BaseModel):
     url: str
-    max_videos: Optional[int] = 50  # Limit to prevent overwhelming requests
+    max_videos: Optional[int] = None  # playlist_default_videos when unset, capped at playlist_max_videos
     include_formats: bool = False   # Whether to extract format info for each video
     
     @field_validator('url')
@@ -308,6 +726,14 @@ class PlaylistInfoRequest(BaseModel):
         if not any(re.match(pattern, v) for pattern in playlist_patterns):
             raise ValueError('Invalid YouTube playlist/channel URL')
         return v
+    
+    @field_validator('max_videos')
+    @classmethod
+    def validate_max_videos(cls, v):
+        # no upper bound here, larger values are capped at playlist_max_videos
+        if v is not None and v < 1:
+            raise ValueError('max_videos must be at least 1')
+        return v
 
 class PlaylistVideoInfo(BaseModel):
     video_id: str
@@ -335,14 +761,47 @@ class PlaylistDownloadRequest(BaseModel):
     video_format_id: Optional[str] = None  # If None, download audio only
     audio_format_id: str
     archive_name: Optional[str] = None  # Custom name for ZIP archive
+    target_codec: Optional[str] = None  # audio-only batches, convert each track after download
+    
+    @field_validator('target_codec')
+    @classmethod
+    def validate_codec(cls, v):
+        return validate_target_codec(v)
     
     @field_validator('selected_videos')
     @classmethod
     def validate_selected_videos(cls, v):
         if not v:
             raise ValueError('At least one video must be selected')
-        if len(v) > 20:  # Limit bulk downloads
-            raise ValueError('Maximum 20 videos can be downloaded at once')
+        if len(v) > performance.batch_max_videos:  # Limit bulk downloads
+            raise ValueError(f'Maximum {performance.batch_max_videos} videos can be downloaded at once')
+        return v
+
+class PlaylistSyncRequest(BaseModel):
+    url: str
+    video_format_id: Optional[str] = None  # If None, download audio only
+    audio_format_id: str
+    target_codec: Optional[str] = None
+    max_new_videos: Optional[int] = None  # playlist_default_videos when unset
+    # channels list newest first so the first known video means the rest is old,
+    # playlists append at the end so they are walked fully; None picks by url
+    stop_at_known: Optional[bool] = None
+    
+    @field_validator('url')
+    @classmethod
+    def validate_playlist_url(cls, v):
+        return PlaylistInfoRequest.validate_playlist_url(v)
+    
+    @field_validator('target_codec')
+    @classmethod
+    def validate_codec(cls, v):
+        return validate_target_codec(v)
+    
+    @field_validator('max_new_videos')
+    @classmethod
+    def validate_max_new_videos(cls, v):
+        if v is not None and (v < 1 or v > performance.playlist_max_videos):
+            raise ValueError(f'max_new_videos must be between 1 and {performance.playlist_max_videos}')
         return v
 
 class DownloadPathRequest(BaseModel):
@@ -410,9 +869,10 @@ def get_enhanced_ydl_opts(base_opts: dict = None) -> dict:
     simple_opts = {
         'quiet': True,
         'no_warnings': True,
-        'retries': 1,
-        'extractor_retries': 1,
-        'fragment_retries': 2,
+        'retries': performance.retries,
+        'extractor_retries': performance.extractor_retries,
+        'fragment_retries': performance.fragment_retries,
+        'concurrent_fragment_downloads': performance.concurrent_fragment_downloads,
         # removed custom headers
     }
     
@@ -424,30 +884,186 @@ def get_enhanced_ydl_opts(base_opts: dict = None) -> dict:
     if DENO_PATH:
         simple_opts['js_runtimes'] = {'deno': {'path': DENO_PATH}}
     
+    simple_opts['cachedir'] = str(YDL_CACHE_DIR)
+    
+    # spread jobs across the cookie pool, none configured means anonymous requests
+    cookiefile = cookie_manager.select_cookiefile()
+    if cookiefile:
+        simple_opts['cookiefile'] = cookiefile
+    
     simple_opts.update(base_opts)
     return simple_opts
 
-def extract_formats(formats_list: List[dict], url: str = "") -> tuple[List[Format], List[Format]]:
+# menu entry -> quality target used to pick concrete formats from the real format table
+VIDEO_QUALITY_TARGETS = {
+    "auto": {"max_height": None},
+    "shorts_auto": {"max_height": 1080},
+    "best_quality": {"max_height": None},
+    "hd_720p": {"max_height": 720},
+    "eco_360p": {"max_height": 360, "allow_combined": True},
+}
+AUDIO_QUALITY_TARGETS = {
+    "auto_audio": {"min_abr": None},
+    "high_audio": {"min_abr": None},
+    "medium_audio": {"min_abr": 96, "max_abr": 160},
+}
+
+class FormatRecord:
+    __slots__ = ('format_id', 'kind', 'ext', 'height', 'fps', 'vcodec', 'acodec', 'tbr', 'abr', 'size', 'protocol')
+    
+    def __init__(self, fmt: dict, duration: float):
+        self.format_id = str(fmt.get('format_id'))
+        self.ext = fmt.get('ext') or ''
+        self.vcodec = fmt.get('vcodec') or 'none'
+        self.acodec = fmt.get('acodec') or 'none'
+        has_video = self.vcodec != 'none'
+        has_audio = self.acodec != 'none'
+        self.kind = 'combined' if has_video and has_audio else 'video' if has_video else 'audio'
+        self.height = fmt.get('height') or 0
+        self.fps = fmt.get('fps') or 0
+        self.tbr = fmt.get('tbr') or 0
+        self.abr = fmt.get('abr') or (self.tbr if self.kind == 'audio' else 0)
+        self.protocol = fmt.get('protocol') or ''
+        # exact size if youtube gave one, otherwise bitrate x duration
+        size = fmt.get('filesize') or fmt.get('filesize_approx')
+        if not size and self.tbr and duration:
+            size = int(self.tbr * 1000 / 8 * duration)
+        self.size = int(size) if size else None
+
+class FormatTable:
+    """real formats of one video indexed by id and kind, with byte estimates
+    
+    selection picks the cheapest formats that meet a quality target instead of
+    letting yt-dlp take the best (and usually biggest) match.
+    """
+    def __init__(self, formats_list: List[dict], duration: Optional[float]):
+        self.duration = duration or 0
+        self.by_id = {}
+        self.video, self.audio, self.combined = [], [], []
+        
+        audio_language_pref = max(
+            (f.get('language_preference') or 0 for f in formats_list if f.get('vcodec') == 'none' and f.get('acodec') not in (None, 'none')),
+            default=0)
+        for fmt in formats_list:
+            if not fmt.get('format_id') or fmt.get('has_drm') or fmt.get('ext') == 'mhtml':
+                continue
+            record = FormatRecord(fmt, self.duration)
+            if record.vcodec == 'none' and record.acodec == 'none':
+                continue
+            if record.size is None:
+                continue
+            # skip dubbed/descriptive tracks so the cheapest audio is still the original language
+            if record.kind == 'audio' and (fmt.get('language_preference') or 0) < audio_language_pref:
+                continue
+            self.by_id[record.format_id] = record
+            getattr(self, record.kind).append(record)
+    
+    def __bool__(self):
+        return bool(self.by_id)
+    
+    def scale(self, time_range: Optional[TimeRange]) -> float:
+        if not time_range or not self.duration:
+            return 1.0
+        return max(0.0, min(self.duration, time_range.end) - time_range.start) / self.duration
+    
+    def pick_audio(self, audio_format_id: str) -> Optional[FormatRecord]:
+        target = AUDIO_QUALITY_TARGETS.get(audio_format_id, {"min_abr": None})
+        candidates = self.audio
+        if target.get("max_abr"):
+            candidates = [f for f in candidates if f.abr <= target["max_abr"]] or candidates
+        if target.get("min_abr"):
+            candidates = [f for f in candidates if f.abr >= target["min_abr"]] or candidates
+        else:
+            # no minimum means best quality, the cheapest copy of the top bitrate tier wins
+            top = max((f.abr for f in candidates), default=0)
+            candidates = [f for f in candidates if f.abr >= top * 0.9]
+        return min(candidates, key=lambda f: (f.size, f.protocol != 'https'), default=None)
+    
+    def pick(self, video_format_id: str, audio_format_id: str, prefer_vcodec: Optional[str] = None) -> Optional[List[FormatRecord]]:
+        """cheapest format(s) for a menu entry, None when the generic selector should be used"""
+        target = VIDEO_QUALITY_TARGETS.get(video_format_id)
+        if target is None:
+            return None
+        
+        max_height = target["max_height"]
+        heights = [f.height for f in self.video + self.combined if not max_height or f.height <= max_height]
+        if not heights:
+            return None
+        height = max(heights)
+        audio = self.pick_audio(audio_format_id)
+        
+        options = []
+        at_height = [f for f in self.video if f.height == height]
+        if prefer_vcodec:
+            at_height = [f for f in at_height if f.vcodec.startswith(prefer_vcodec)] or at_height
+        if at_height and audio:
+            top_fps = max(f.fps for f in at_height)
+            for video in at_height:
+                if video.fps == top_fps:
+                    options.append([video, audio])
+        if target.get("allow_combined") or not options:
+            options += [[f] for f in self.combined if f.height == height]
+        if not options:
+            return None
+        return min(options, key=lambda combo: (sum(f.size for f in combo), any(f.protocol != 'https' for f in combo)))
+    
+    def estimate(self, records: Optional[List[FormatRecord]], time_range: Optional[TimeRange] = None) -> Optional[int]:
+        if not records:
+            return None
+        return int(sum(f.size for f in records) * self.scale(time_range))
+
+def extract_formats(formats_list: List[dict], url: str = "", duration: Optional[float] = None,
+                    time_range: Optional[TimeRange] = None) -> tuple[List[Format], List[Format]]:
     # shorts get single auto format, regular videos get full options
+    table = FormatTable(formats_list, duration)
+    
+    def video_size(format_id):
+        return table.estimate(table.pick(format_id, "auto_audio"), time_range)
+    
+    def audio_size(format_id):
+        audio = table.pick_audio(format_id)
+        return table.estimate([audio] if audio else None, time_range)
+    
     if is_youtube_shorts(url):
-        video_formats = [Format(format_id="shorts_auto", quality="Auto", ext="mp4", filesize=None, type="auto")]
-        audio_formats = [Format(format_id="auto_audio", quality="Auto", ext="m4a", filesize=None, type="audio")]
+        video_formats = [Format(format_id="shorts_auto", quality="Auto", ext="mp4", filesize=video_size("shorts_auto"), type="auto")]
+        audio_formats = [Format(format_id="auto_audio", quality="Auto", ext="m4a", filesize=audio_size("auto_audio"), type="audio")]
     else:
         video_formats = [
-            Format(format_id="auto", quality="Auto (Recommended)", ext="mp4/webm", filesize=None, type="auto"),
-            Format(format_id="best_quality", quality="Best Quality", ext="mp4/webm", filesize=None, type="video"),
-            Format(format_id="hd_720p", quality="720p HD", ext="mp4/webm", filesize=None, type="video"),
-            Format(format_id="eco_360p", quality="360p (Fast)", ext="mp4", filesize=None, type="combined")
+            Format(format_id="auto", quality="Auto (Recommended)", ext="mp4/webm", filesize=video_size("auto"), type="auto"),
+            Format(format_id="best_quality", quality="Best Quality", ext="mp4/webm", filesize=video_size("best_quality"), type="video"),
+            Format(format_id="hd_720p", quality="720p HD", ext="mp4/webm", filesize=video_size("hd_720p"), type="video"),
+            Format(format_id="eco_360p", quality="360p (Fast)", ext="mp4", filesize=video_size("eco_360p"), type="combined")
         ]
         audio_formats = [
-            Format(format_id="auto_audio", quality="Auto", ext="m4a", filesize=None, type="audio"),
-            Format(format_id="high_audio", quality="High Quality", ext="m4a", filesize=None, type="audio"),
-            Format(format_id="medium_audio", quality="Medium Quality", ext="m4a", filesize=None, type="audio")
+            Format(format_id="auto_audio", quality="Auto", ext="m4a", filesize=audio_size("auto_audio"), type="audio"),
+            Format(format_id="high_audio", quality="High Quality", ext="m4a", filesize=audio_size("high_audio"), type="audio"),
+            Format(format_id="medium_audio", quality="Medium Quality", ext="m4a", filesize=audio_size("medium_audio"), type="audio")
         ]
     
     return video_formats, audio_formats
 
 
+def select_format_string(info: dict, video_format_id: str, audio_format_id: str,
+                         prefer_vcodec: Optional[str] = None) -> Optional[str]:
+    """concrete cheapest format ids for this video, with the generic selector as fallback"""
+    generic = get_format_selector(video_format_id, audio_format_id)
+    table = FormatTable(info.get('formats') or [], info.get('duration'))
+    picked = table.pick(video_format_id, audio_format_id, prefer_vcodec)
+    if not picked:
+        return generic
+    # auto downloads the pick it was sized by, falling back to yt-dlp's own default
+    return f"{'+'.join(f.format_id for f in picked)}/{generic or YTDLP_DEFAULT_FORMAT}"
+
+def select_audio_format_string(info: dict, format_id: str) -> str:
+    generic = get_audio_format_selector(format_id)
+    audio = FormatTable(info.get('formats') or [], info.get('duration')).pick_audio(format_id)
+    if not audio:
+        return generic
+    return f"{audio.format_id}/{generic}"
+
+
+YTDLP_DEFAULT_FORMAT = "bestvideo*+bestaudio/best"
+
 def get_format_selector(video_format_id: str, audio_format_id: str) -> Optional[str]:
     # convert format ids to yt-dlp selectors
     if video_format_id == "auto":
@@ -490,170 +1106,1321 @@ def get_ydl_opts_with_time_range(base_opts: dict, time_range: Optional[TimeRange
         base_opts.pop('postprocessor_args', None)
     return base_opts
 
-async def extract_info_async(url: str, opts: dict) -> dict:
-    loop = asyncio.get_event_loop()
-    return await loop.run_in_executor(executor, _extract_info_blocking, url, opts)
+# STREAMING MERGE
+# separate video+audio normally land as two files that ffmpeg reads back into a third.
+# when both picked components are plain http files, ffmpeg reads the two urls itself and
+# muxes them in one pass (yt-dlp's FFmpegFD direct merge), only the final file touches disk.
+# opt-in: FFmpegFD reports progress only when it finishes (no live job progress, nothing to
+# stream early) and reads each url in one unranged request instead of yt-dlp's http chunks,
+# which youtube tends to throttle. by default merges use the parallel component fetch below
+STREAMING_MERGE = os.environ.get("CLIPLY_STREAMING_MERGE", "").lower() in ("1", "true", "yes")
+STREAMING_MERGE_PROTOCOLS = ('http', 'https')
 
-async def download_async(url: str, opts: dict) -> None:
-    loop = asyncio.get_event_loop()
-    return await loop.run_in_executor(executor, _download_blocking, url, opts)
+def picked_format_ids(format_string: Optional[str]) -> List[str]:
+    """concrete ids in front of the generic fallback of a select_format_string result"""
+    if not format_string:
+        return []
+    return format_string.split('/')[0].split('+')
 
-async def download_with_fallback(url: str, base_opts: dict) -> None:
-    """Download using yt-dlp's built-in retry mechanisms"""
-    # Let yt-dlp handle fallbacks automatically with its built-in retry system
-    opts = get_enhanced_ydl_opts(base_opts)
-    await download_async(url, opts)
+def picked_format_pair(info: dict, format_string: Optional[str]) -> Optional[List[dict]]:
+    """the two formats of a concrete video+audio pick, None when format_string starts with
+    a generic selector instead (no pick for this video) or names ids the video doesn't have"""
+    format_ids = picked_format_ids(format_string)
+    if len(format_ids) != 2:
+        return None
+    formats = {str(f.get('format_id')): f for f in info.get('formats') or []}
+    if not all(format_id in formats for format_id in format_ids):
+        return None
+    return [formats[format_id] for format_id in format_ids]
 
-def _extract_info_blocking(url: str, opts: dict) -> dict:
-    with yt_dlp.YoutubeDL(opts) as ydl:
-        return ydl.extract_info(url, download=False)
+def can_stream_merge(info: dict, format_string: Optional[str]) -> bool:
+    """the concrete pair from select_format_string is two progressive http downloads"""
+    if not (STREAMING_MERGE and FFMPEG_PATH):
+        return False
+    pair = picked_format_pair(info, format_string)
+    return pair is not None and all(f.get('protocol') in STREAMING_MERGE_PROTOCOLS for f in pair)
 
-def _download_blocking(url: str, opts: dict) -> None:
-    with yt_dlp.YoutubeDL(opts) as ydl:
-        ydl.download([url])
+def get_ydl_opts_for_streaming_merge(base_opts: dict) -> dict:
+    # routes http formats to ffmpeg, which yt-dlp then hands both requested formats at once
+    base_opts['external_downloader'] = {'http': 'ffmpeg'}
+    return base_opts
 
-async def extract_video_info_with_fallback(url: str) -> dict:
-    """Extract video info using yt-dlp's built-in retry mechanisms"""
-    # Let yt-dlp handle fallbacks automatically with its built-in retry system
-    opts = get_enhanced_ydl_opts()
-    return await extract_info_async(url, opts)
+# PARALLEL COMPONENT FETCH
+# merges that still go through files (fragmented dash/hls components, or a failed streaming
+# merge) would otherwise fetch the video and then the audio. both are fetched side by side
+# and muxed afterwards, so wall time follows the longer stream instead of the sum
+PARALLEL_COMPONENTS = os.environ.get("CLIPLY_PARALLEL_COMPONENTS", "1").lower() not in ("0", "false", "no")
 
-async def extract_playlist_info_with_fallback(url: str, max_videos: int = 50, include_formats: bool = False) -> dict:
-    """Extract playlist info using yt-dlp's built-in retry mechanisms"""
-    base_playlist_opts = {
-        'extract_flat': not include_formats,
-        'playlist_items': f'1:{max_videos}',
-    }
+def can_fetch_components_in_parallel(info: dict, format_string: Optional[str]) -> bool:
+    return bool(PARALLEL_COMPONENTS and FFMPEG_PATH) and picked_format_pair(info, format_string) is not None
+
+def _download_from_info_blocking(info: dict, opts: dict) -> None:
+    # like yt-dlp's --load-info-json: reuse the extraction instead of repeating it per component
+    with ydl_pool.acquire(opts) as ydl:
+        ydl.process_ie_result(yt_dlp.YoutubeDL.sanitize_info(info, remove_private_keys=True), download=True)
+
+async def download_component(url: str, info: dict, base_opts: dict, format_id: str, directory: Path,
+                             base_name: str) -> Path:
+    opts = dict(base_opts)
+    opts['format'] = format_id
+    opts['outtmpl'] = str(directory / f"{base_name}.f{format_id}.%(ext)s")
+    opts.pop('merge_output_format', None)
+    # a queued job gets the progress of both halves summed up instead, see download_components_parallel.
+    # each task runs in its own copy of the context, so this doesn't leak into the handler
+    job_progress_hook.set(None)
+    await _run_with_cookie_health(lambda _url, opts: _download_from_info_blocking(info, opts),
+                                  url, build_download_opts(opts), lane="download")
+    prefix = f"{base_name}.f{format_id}."
+    for path in directory.iterdir():
+        if path.name.startswith(prefix) and not path.name.endswith(('.part', '.ytdl')):
+            return path
+    raise RuntimeError(f"component {format_id} finished but no file was written")
+
+def merge_components(video: Path, audio: Path, output: Path):
+    # each component was a single-format download, so yt-dlp already ran its fixups on it
+    # (FixupM4a on the dash audio, FixupStretched on the video, whose aspect -c copy keeps)
+    temp = output.with_name(f"{output.stem}.temp{output.suffix}")
+    _run_ffmpeg(['-i', str(video), '-i', str(audio), '-map', '0:v:0', '-map', '1:a:0',
+                 '-c', 'copy', '-movflags', '+faststart', str(temp)])
+    os.replace(temp, output)
+
+async def download_components_parallel(url: str, info: dict, base_opts: dict, format_string: str,
+                                       directory: Path, base_name: str) -> Path:
+    """fetch the picked video and audio formats concurrently, then mux them into base_name.mp4"""
+    video_id, audio_id = picked_format_ids(format_string)
+    halted = threading.Event()
+    
+    def halt_hook(d):
+        # a failed half makes the other pointless, stop it at its next chunk
+        if halted.is_set():
+            raise DownloadCancelled("other component failed")
+    
+    report_progress = job_progress_hook.get()
+    progress = {}
+    
+    def combined_progress_hook(format_id):
+        def hook(d):
+            progress[format_id] = d
+            if report_progress is None:
+                return
+            parts = [progress.get(video_id) or {}, progress.get(audio_id) or {}]
+            totals = [part.get('total_bytes') or part.get('total_bytes_estimate') for part in parts]
+            report_progress({
+                "status": 'finished' if all(part.get('status') == 'finished' for part in parts) else 'downloading',
+                "filename": f"{base_name}.mp4",
+                "downloaded_bytes": sum(part.get('downloaded_bytes') or 0 for part in parts),
+                "total_bytes": sum(totals) if all(totals) else None,
+                "speed": sum(part.get('speed') or 0 for part in parts if part.get('status') == 'downloading') or None,
+                "eta": max((part.get('eta') or 0 for part in parts), default=None),
+            })
+        return hook
     
+    # the playback hook follows the video half only, the file a range request reads must not
+    # switch between the two .part files (and their sizes) from one chunk to the next
+    preview_hooks = list(base_opts.get('progress_hooks', []))
+    fetches = []
+    for format_id, hooks in ((video_id, preview_hooks), (audio_id, [])):
+        opts = dict(base_opts)
+        opts['progress_hooks'] = hooks + [halt_hook, combined_progress_hook(format_id)]
+        fetches.append(asyncio.ensure_future(download_component(url, info, opts, format_id, directory, base_name)))
     try:
-        # Let yt-dlp handle fallbacks automatically with its built-in retry system
-        opts = get_enhanced_ydl_opts(base_playlist_opts)
-        return await extract_info_async(url, opts)
-    except Exception as e:
-        error_msg = str(e)
-        # Still handle the specific cookie-related error for playlists
-        if "Sign in to confirm" in error_msg and not cookie_manager.has_valid_cookies():
-            raise HTTPException(
-                status_code=503,
-                detail={
-                    "error": "YouTube bot detection triggered for playlist",
-                    "message": "Server needs YouTube cookies to access playlists",
-                    "has_cookies": False,
-                    "solution": "Admin needs to update server cookies"
-                }
-            )
-        raise e
+        video, audio = await asyncio.gather(*fetches)
+    except Exception:
+        halted.set()
+        # the halves run on executor threads, wait until both have let go of their upstream slots
+        await asyncio.gather(*fetches, return_exceptions=True)
+        raise
+    output = directory / f"{base_name}.mp4"
+    try:
+        await run_in_executor_with_context(executor, merge_components, video, audio, output)
+    finally:
+        video.unlink(missing_ok=True)
+        audio.unlink(missing_ok=True)
+    return output
 
-def process_playlist_entries(entries: List[dict], include_formats: bool = False) -> List[PlaylistVideoInfo]:
-    videos = []
-    
-    for i, entry in enumerate(entries):
+# SMART CUT
+# precise cuts re-encode only the partial GOPs at each edge and stream-copy the keyframe-aligned middle
+SMART_CUT_CODECS = ('h264',)
+SMART_CUT_MIN_EDGE = 0.001  # seconds, edges shorter than this don't need a re-encode
+
+def can_smart_cut() -> bool:
+    return bool(FFMPEG_PATH and FFPROBE_PATH)
+
+def get_ydl_opts_for_smart_cut(base_opts: dict, time_range: TimeRange) -> dict:
+    """download the range stream-copied (keyframe-snapped), the precise cut happens afterwards"""
+    base_opts['download_ranges'] = download_range_func(None, [(time_range.start, time_range.end)])
+    # among formats of the same resolution prefer h264, the codec smart cut can splice
+    base_opts['format_sort'] = ['res', 'vcodec:h264']
+    base_opts.pop('postprocessor_args', None)
+    return base_opts
+
+def _run_ffmpeg(args: List[str], read_stdout: Optional[Callable] = None):
+    """run ffmpeg as part of the current download (killed if it is cancelled);
+    read_stdout consumes the raw output stream of ffmpeg writing to pipe:1"""
+    control = current_download.get()
+    if control is not None:
+        control.check()
+    # stderr goes to a file so a chatty ffmpeg can't block on a full pipe while stdout is read
+    with tempfile.TemporaryFile() as stderr:
+        proc = subprocess.Popen([FFMPEG_PATH, '-hide_banner', '-loglevel', 'error', '-y', *args],
+                                stdout=subprocess.PIPE if read_stdout else subprocess.DEVNULL, stderr=stderr)
+        if control is not None:
+            control.register_process(proc)
         try:
-            video_id = entry.get('id', '')
-            title = entry.get('title', f'Video {i+1}')
-            duration = entry.get('duration', 0)
-            thumbnail = entry.get('thumbnail')
-            uploader = entry.get('uploader', entry.get('channel', 'Unknown'))
-            
-            # Construct video URL
-            video_url = f"https://www.youtube.com/watch?v={video_id}"
-            
-            video_formats = []
-            audio_formats = []
-            
-            if include_formats and entry.get('formats'):
-                video_formats, audio_formats = extract_formats(entry.get('formats', []), video_url)
-            
-            video_info = PlaylistVideoInfo(
-                video_id=video_id,
-                title=title,
-                duration=duration,
-                duration_string=format_duration(duration),
-                thumbnail=thumbnail,
-                uploader=uploader,
-                index=i,
-                url=video_url,
-                video_formats=video_formats,
-                audio_formats=audio_formats
-            )
-            
-            videos.append(video_info)
-            
-        except Exception as e:
-            continue
-    
-    return videos
+            if read_stdout:
+                read_stdout(proc.stdout)
+            proc.wait()
+        finally:
+            if proc.poll() is None:
+                kill_process(proc)
+        if control is not None:
+            control.check()
+        if proc.returncode != 0:
+            stderr.seek(0)
+            raise RuntimeError(f"ffmpeg failed: {stderr.read().decode(errors='replace')[-500:]}")
 
-@app.get("/", include_in_schema=False)
-async def root():
-    """Basic status endpoint with download awareness"""
-    return {
-        "message": "Cliply Desktop Server",
-        "version": "1.0.0",
-        "status": "running",
-        "active_downloads": len(active_downloads),
-        "downloads_directory": str(get_downloads_directory()),
-        "cookies": cookie_manager.has_valid_cookies(),
-        "ffmpeg_available": FFMPEG_PATH is not None,
-        "ffmpeg_path": str(FFMPEG_PATH) if FFMPEG_PATH else None,
-        "deno_available": DENO_PATH is not None,
-        "deno_path": str(DENO_PATH) if DENO_PATH else None
-    }
+def probe_video_stream(path: Path) -> dict:
+    result = subprocess.run([FFPROBE_PATH, '-v', 'error', '-select_streams', 'v:0',
+                           '-show_entries', 'stream=codec_name,profile,pix_fmt,width,height',
+                           '-of', 'json', str(path)],
+                          capture_output=True, text=True, timeout=30)
+    streams = json.loads(result.stdout or '{}').get('streams', [])
+    return streams[0] if streams else {}
 
-@app.get("/docs", response_class=HTMLResponse, include_in_schema=False)
-async def get_docs():
-    """API documentation"""
-    return get_swagger_ui_html(
-        openapi_url="/openapi.json",
-        title=app.title + " - API Documentation",
-        swagger_favicon_url="/favicon.ico"
-    )
+def build_keyframe_index(path: Path) -> List[float]:
+    """presentation times of every video keyframe, read from packet flags without decoding"""
+    result = subprocess.run([FFPROBE_PATH, '-v', 'error', '-select_streams', 'v:0',
+                           '-show_entries', 'packet=pts_time,flags', '-of', 'csv=p=0', str(path)],
+                          capture_output=True, text=True, timeout=120)
+    keyframes = []
+    for line in result.stdout.splitlines():
+        parts = line.strip().split(',')
+        if len(parts) >= 2 and 'K' in parts[1]:
+            try:
+                keyframes.append(float(parts[0]))
+            except ValueError:
+                continue
+    return sorted(keyframes)
 
-@app.get("/openapi.json", include_in_schema=False)
-async def get_openapi():
-    """OpenAPI schema"""
-    return app.openapi()
+def _x264_args(stream: dict) -> List[str]:
+    # parameter sets go in-band so the decoder picks them up again after the copied middle
+    args = ['-c:v', 'libx264', '-preset', 'veryfast', '-crf', '18', '-x264-params', 'repeat-headers=1']
+    if stream.get('pix_fmt'):
+        args += ['-pix_fmt', stream['pix_fmt']]
+    profile = (stream.get('profile') or '').lower().replace('constrained ', '')
+    if profile in ('baseline', 'main', 'high'):
+        args += ['-profile:v', profile]
+    return args
 
+def reencode_cut(source: Path, output: Path, duration: float):
+    """frame-accurate cut by re-encoding everything, same cost as force_keyframes_at_cuts"""
+    _run_ffmpeg(['-ss', '0', '-i', str(source), '-t', f"{duration:.6f}",
+                 '-c:v', 'libx264', '-preset', 'veryfast', '-crf', '18',
+                 '-c:a', 'aac', '-movflags', '+faststart', str(output)])
 
-@app.post("/api/video/info", response_model=VideoInfoResponse)
-async def get_video_info(request: VideoInfoRequest):
-    """Get video information with format details"""
+def smart_cut(source: Path, output: Path, duration: float):
+    """cut [0, duration) of source frame-accurately, re-encoding only the edge GOPs
+    
+    source is the range download, whose timeline starts at the requested start with any
+    keyframe pre-roll at negative timestamps. falls back to a full re-encode when the
+    codec can't be spliced or there's no whole GOP inside the range.
+    """
+    stream = probe_video_stream(source)
+    keyframes = build_keyframe_index(source)
+    inner = [k for k in keyframes if 0 <= k <= duration]
+    if stream.get('codec_name') not in SMART_CUT_CODECS or len(inner) < 2:
+        reencode_cut(source, output, duration)
+        return
+    
+    head_end, tail_start = inner[0], inner[-1]
+    has_head = head_end > SMART_CUT_MIN_EDGE
+    has_tail = duration - tail_start > SMART_CUT_MIN_EDGE
+    encode_args = _x264_args(stream)
+    work_dir = Path(tempfile.mkdtemp(prefix="cliply_smartcut_", dir=str(output.parent)))
     try:
-        info = await extract_video_info_with_fallback(request.url)
-        video_formats, audio_formats = extract_formats(info.get('formats', []), request.url)
+        # the segment muxer splits exactly on keyframes in decode order, so the copied
+        # middle holds whole GOPs with no duplicated or missing frames at either end
+        split_points = ([head_end] if has_head else []) + [tail_start]
+        _run_ffmpeg(['-i', str(source), '-map', '0:v:0', '-c:v', 'copy', '-bsf:v', 'h264_mp4toannexb',
+                     '-f', 'segment', '-segment_format', 'mp4', '-reset_timestamps', '1',
+                     '-segment_times', ','.join(f"{max(0.0, t - SMART_CUT_MIN_EDGE):.6f}" for t in split_points),
+                     str(work_dir / "gop%d.mp4")])
+        middle = work_dir / ("gop1.mp4" if has_head else "gop0.mp4")
         
-        return VideoInfoResponse(
-            title=info.get('title', 'Unknown'),
-            duration=info.get('duration', 0),
-            duration_string=format_duration(info.get('duration', 0)),
-            thumbnail=info.get('thumbnail'),
-            uploader=info.get('uploader', 'Unknown'),
-            video_formats=video_formats,
-            audio_formats=audio_formats
-        )
+        segments = []
+        if has_head:
+            head = work_dir / "head.mp4"
+            _run_ffmpeg(['-ss', '0', '-i', str(source), '-t', f"{head_end:.6f}", '-an',
+                         *encode_args, str(head)])
+            segments.append(head)
+        
+        segments.append(middle)
+        
+        if has_tail:
+            tail = work_dir / "tail.mp4"
+            _run_ffmpeg(['-ss', f"{tail_start:.6f}", '-i', str(source), '-t', f"{duration - tail_start:.6f}", '-an',
+                         *encode_args, str(tail)])
+            segments.append(tail)
+        
+        concat_list = work_dir / "segments.txt"
+        concat_list.write_text(''.join(f"file '{segment.as_posix()}'\n" for segment in segments))
         
+        # audio is cheap to encode, so it is cut exactly in one pass rather than spliced
+        _run_ffmpeg(['-f', 'concat', '-safe', '0', '-i', str(concat_list),
+                     '-ss', '0', '-t', f"{duration:.6f}", '-i', str(source),
+                     '-map', '0:v:0', '-map', '1:a:0?', '-c:v', 'copy', '-c:a', 'aac',
+                     '-movflags', '+faststart', str(output)])
     except Exception as e:
-        raise HTTPException(status_code=400, detail=f"Failed to get video info: {str(e)}")
+        print(f"smart cut failed, re-encoding the whole clip: {e}")
+        output.unlink(missing_ok=True)
+        reencode_cut(source, output, duration)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
 
-@app.post("/api/video/download-combined")
-async def download_combined_video_audio(request: CombinedDownloadRequest):
-    """download and merge video+audio with optional time range"""
-    download_id = str(uuid.uuid4())
+async def smart_cut_async(source: Path, output: Path, duration: float) -> None:
+    return await run_in_executor_with_context(executor, smart_cut, source, output, duration)
+
+# AUDIO TRANSCODING
+# every conversion is its own ffmpeg process, so this only bounds how many run at once
+transcode_executor = ThreadPoolExecutor(max_workers=performance.transcode_workers, thread_name_prefix="transcode")
+
+def probe_audio_codec(path: Path) -> Optional[str]:
+    if not FFPROBE_PATH:
+        return None
+    try:
+        result = subprocess.run([FFPROBE_PATH, '-v', 'error', '-select_streams', 'a:0',
+                               '-show_entries', 'stream=codec_name', '-of', 'csv=p=0', str(path)],
+                              capture_output=True, text=True, timeout=30)
+        return result.stdout.strip() or None
+    except Exception:
+        return None
+
+def transcode_audio(source: Path, target_codec: str) -> Path:
+    """convert source to target_codec next to it and remove the original, returns the new file"""
+    target = AUDIO_TARGET_CODECS[target_codec]
+    output = source.with_suffix(f".{target['ext']}")
+    if output == source:
+        output = source.with_name(f"{source.stem}.converted.{target['ext']}")
+    
+    # already the right codec, just move it into the target container
+    if probe_audio_codec(source) == target['codec_name']:
+        codec_args = ['-c:a', 'copy']
+    else:
+        codec_args = target['args']
     
     try:
+        # one thread per ffmpeg, parallelism comes from running several conversions at once
+        _run_ffmpeg(['-i', str(source), '-vn', '-map', '0:a:0', '-threads', '1', *codec_args, str(output)])
+    except Exception:
+        output.unlink(missing_ok=True)
+        raise
+    
+    source.unlink(missing_ok=True)
+    if output.name.endswith(f".converted.{target['ext']}"):
+        output = output.rename(source.with_suffix(f".{target['ext']}"))
+    return output
 
-        active_downloads[download_id] = {
-            "type": "combined",
-            "url": request.url,
-            "started": time.time()
-        }
-        
-        info = await extract_video_info_with_fallback(request.url)
-        title = sanitize_filename(info.get('title', 'video'))
-        
+async def transcode_audio_async(source: Path, target_codec: str) -> Path:
+    return await run_in_executor_with_context(transcode_executor, transcode_audio, source, target_codec)
 
-        quality = get_quality_label(request.video_format_id)
-        timestamp = int(time.time() * 1000) % 100000
+# CANCELLATION
+CANCELLED_STATUS_CODE = 499  # nginx's "client closed request", there is usually nobody left to read it
+DISCONNECT_POLL_INTERVAL = 1.0
+
+class DownloadCancelled(yt_dlp.utils.DownloadCancelled):
+    """raised inside a cancelled download, yt-dlp lets this type propagate out of download()"""
+
+# the control of the download the current task (and executor calls made from it) belongs to
+current_download = contextvars.ContextVar("current_download", default=None)
+
+def kill_process(proc: subprocess.Popen):
+    try:
+        if proc.poll() is None:
+            proc.kill()
+    except OSError:
+        pass
+
+class DownloadControl:
+    """cancel flag of one download plus the child processes (yt-dlp's ffmpeg and ours) to kill with it"""
+    def __init__(self):
+        self.cancelled = False
+        self.watcher = None
+        self._processes = weakref.WeakSet()
+        self._lock = threading.Lock()
+        # bytes yt-dlp has written per output file, for the disk admission
+        self._written = {}
+    
+    def cancel(self):
+        # called on the event loop
+        with self._lock:
+            if self.cancelled:
+                return
+            self.cancelled = True
+            processes = list(self._processes)
+        for proc in processes:
+            kill_process(proc)
+        # a job queued for disk space should notice right away
+        disk_admission.wake()
+    
+    def check(self):
+        if self.cancelled:
+            raise DownloadCancelled("Download cancelled")
+    
+    def progress_hook(self, d):
+        # yt-dlp calls this between chunks, raising here stops the transfer cooperatively
+        self.check()
+        if d.get('filename') and d.get('downloaded_bytes'):
+            with self._lock:
+                self._written[d['filename']] = d['downloaded_bytes']
+    
+    def written_bytes(self) -> int:
+        with self._lock:
+            return sum(self._written.values())
+    
+    def reset_written(self):
+        with self._lock:
+            self._written.clear()
+    
+    def register_process(self, proc: subprocess.Popen):
+        with self._lock:
+            if not self.cancelled:
+                self._processes.add(proc)
+                return
+        kill_process(proc)
+
+_ydl_popen_init = yt_dlp.utils.Popen.__init__
+
+def _tracked_popen_init(self, *args, **kwargs):
+    # every subprocess yt-dlp starts (ffmpeg downloader, merger, fixups) belongs to the current download
+    _ydl_popen_init(self, *args, **kwargs)
+    control = current_download.get()
+    if control is not None:
+        control.register_process(self)
+
+yt_dlp.utils.Popen.__init__ = _tracked_popen_init
+
+def run_in_executor_with_context(pool: ThreadPoolExecutor, func, *args):
+    """run_in_executor that carries the caller's contextvars (the current download) into the thread"""
+    return asyncio.get_event_loop().run_in_executor(pool, contextvars.copy_context().run, func, *args)
+
+async def watch_client_disconnect(http_request: Request, on_disconnect: Callable[[], None]):
+    """poll the caller's connection and cancel its work once it has gone away"""
+    while not await http_request.is_disconnected():
+        await asyncio.sleep(DISCONNECT_POLL_INTERVAL)
+    print("client disconnected, cancelling its download")
+    on_disconnect()
+
+def begin_download(download_id: str, entry: dict, http_request: Optional[Request] = None) -> DownloadControl:
+    """track a running download and make it cancellable by DELETE /api/jobs/{id} or a client disconnect"""
+    # a queue worker has already set up a control for the job it is running
+    control = current_download.get() or DownloadControl()
+    current_download.set(control)
+    entry["control"] = control
+    active_downloads[download_id] = entry
+    if http_request is not None:
+        control.watcher = asyncio.ensure_future(watch_client_disconnect(http_request, control.cancel))
+    return control
+
+def end_download(download_id: str):
+    entry = active_downloads.pop(download_id, None)
+    control = entry.get("control") if entry else None
+    if control is not None and control.watcher is not None:
+        control.watcher.cancel()
+
+def remove_partial_files(directory: Path, prefix: Optional[str]):
+    """delete everything a cancelled download left under prefix: .part files, stream parts, uncut sources"""
+    if not prefix:
+        return
+    try:
+        for path in directory.iterdir():
+            if path.name.startswith(f"{prefix}.") and path.is_file():
+                path.unlink(missing_ok=True)
+    except OSError as e:
+        print(f"failed to clean up partial files for {prefix}: {e}")
+
+# DISK ADMISSION
+DISK_SAFETY_MARGIN = 512 * 1024 * 1024  # always leave this much free on the downloads volume
+DISK_ADMISSION_TIMEOUT = 1800  # seconds a job may wait for space before it is rejected
+DISK_ADMISSION_POLL = 5  # re-check free space this often, files may be removed outside cliply
+
+# rough bitrates for sizing jobs whose real format table isn't known (flat playlist entries)
+FALLBACK_BITRATES_KBPS = {
+    "auto": 6000,
+    "best_quality": 8000,
+    "shorts_auto": 4000,
+    "hd_720p": 2500,
+    "eco_360p": 700,
+    "audio": 160,
+}
+# output bitrate of audio conversions, wav/flac can be far bigger than the source
+TRANSCODE_BITRATES_KBPS = {"mp3": 190, "opus": 160, "aac": 192, "flac": 900, "wav": 1411}
+
+INSUFFICIENT_STORAGE_STATUS_CODE = 507  # webdav's "insufficient storage", retrying later may fit
+
+class InsufficientDiskSpace(Exception):
+    pass
+
+def estimate_transcode_bytes(target_codec: Optional[str], seconds: float) -> int:
+    if not target_codec:
+        return 0
+    return int(TRANSCODE_BITRATES_KBPS[target_codec] * 1000 / 8 * seconds)
+
+def estimate_fallback_bytes(video_format_id: Optional[str], seconds: float) -> int:
+    kbps = FALLBACK_BITRATES_KBPS.get(video_format_id or "audio", FALLBACK_BITRATES_KBPS["auto"])
+    if video_format_id:
+        kbps += FALLBACK_BITRATES_KBPS["audio"]
+    return int(kbps * 1000 / 8 * seconds)
+
+def estimate_video_job_peak(info: dict, video_format_id: str, audio_format_id: str,
+                            time_range: Optional[TimeRange], smart_cut: bool = False,
+                            streaming_merge: bool = False) -> int:
+    """peak bytes on disk while a single video job runs, final file plus merge/cut scratch"""
+    table = FormatTable(info.get('formats') or [], info.get('duration'))
+    picked = table.pick(video_format_id, audio_format_id)
+    size = table.estimate(picked, time_range)
+    if size is None:
+        seconds = (time_range.end - time_range.start) if time_range else (info.get('duration') or 0)
+        size = estimate_fallback_bytes(video_format_id, seconds)
+        picked = [None, None]
+    
+    # separate streams are merged into a third file, smart cut adds the uncut range and segments
+    factor = 2 if len(picked) > 1 and not streaming_merge else 1
+    if time_range and smart_cut:
+        factor += 1
+    return size * factor
+
+def estimate_audio_job_peak(info: dict, format_id: str, time_range: Optional[TimeRange],
+                            target_codec: Optional[str]) -> int:
+    table = FormatTable(info.get('formats') or [], info.get('duration'))
+    audio = table.pick_audio(format_id)
+    seconds = (time_range.end - time_range.start) if time_range else (info.get('duration') or 0)
+    size = table.estimate([audio] if audio else None, time_range)
+    if size is None:
+        size = estimate_fallback_bytes(None, seconds)
+    return size + estimate_transcode_bytes(target_codec, seconds)
+
+def estimate_batch_peak(entries: List[dict], video_format_id: Optional[str], target_codec: Optional[str],
+                        zipped: bool) -> int:
+    """every file of the batch, the archive built from them, and one merge in flight"""
+    sizes = []
+    for entry in entries:
+        seconds = entry.get('duration') or 0
+        size = estimate_fallback_bytes(video_format_id, seconds)
+        if not video_format_id:
+            size += estimate_transcode_bytes(target_codec, seconds)
+        sizes.append(size)
+    total = sum(sizes)
+    if zipped and len(sizes) > 1:
+        total *= 2
+    return total + (max(sizes, default=0) if video_format_id else 0)
+
+class DiskAdmissionController:
+    """reserve each job's estimated peak disk use against free space on the downloads volume
+    
+    jobs that don't fit wait until running jobs release their reservation instead of
+    filling the disk and failing mid-transfer. a job that can't fit even on an idle
+    volume is rejected straight away.
+    """
+    def __init__(self, margin: int = DISK_SAFETY_MARGIN):
+        self.margin = margin
+        self.reservations = {}
+        self.waiting = 0
+        self._changed = asyncio.Event()
+    
+    @property
+    def reserved(self) -> int:
+        """the part of each reservation its job hasn't written yet, free space already counts the rest.
+        bytes ffmpeg writes (merges, cuts, conversions) aren't reported, so that part stays reserved"""
+        outstanding = 0
+        for job_id, nbytes in self.reservations.items():
+            control = active_downloads.get(job_id, {}).get("control")
+            written = control.written_bytes() if control is not None else 0
+            outstanding += max(0, nbytes - written)
+        return outstanding
+    
+    async def reserve(self, job_id: str, nbytes: int, path: Path, timeout: float = DISK_ADMISSION_TIMEOUT):
+        deadline = time.monotonic() + timeout
+        waiting = False
+        try:
+            while True:
+                control = active_downloads.get(job_id, {}).get("control")
+                if control is not None:
+                    control.check()
+                usable = shutil.disk_usage(path).free - self.margin
+                if nbytes <= usable - self.reserved:
+                    # a re-reservation follows a cleaned up attempt, its files no longer count
+                    if control is not None:
+                        control.reset_written()
+                    self.reservations[job_id] = nbytes
+                    return
+                # running jobs only ever take space, so a job bigger than what's free now never fits
+                if nbytes > usable or not self.reservations:
+                    raise InsufficientDiskSpace(
+                        f"not enough disk space: job needs ~{nbytes // (1024 * 1024)} MB, "
+                        f"{max(0, usable) // (1024 * 1024)} MB available")
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise InsufficientDiskSpace("timed out waiting for disk space")
+                if not waiting:
+                    waiting = True
+                    self.waiting += 1
+                    if job_id in active_downloads:
+                        active_downloads[job_id]["status"] = "waiting_for_disk"
+                changed = self._changed
+                try:
+                    await asyncio.wait_for(changed.wait(), timeout=min(DISK_ADMISSION_POLL, remaining))
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            if waiting:
+                self.waiting -= 1
+                if job_id in active_downloads:
+                    active_downloads[job_id]["status"] = "running"
+    
+    def release(self, job_id: str):
+        if self.reservations.pop(job_id, None) is not None:
+            self.wake()
+    
+    def wake(self):
+        # wake every waiter, each re-checks against the new free space (or its cancel flag)
+        self._changed.set()
+        self._changed = asyncio.Event()
+    
+    def stats(self, path: Path) -> dict:
+        usage = shutil.disk_usage(path)
+        return {
+            "path": str(path),
+            "free": usage.free,
+            "reserved": self.reserved,
+            "margin": self.margin,
+            "available": max(0, usage.free - self.margin - self.reserved),
+            "running_jobs": len(self.reservations),
+            "waiting_jobs": self.waiting
+        }
+
+disk_admission = DiskAdmissionController()
+
+# UPSTREAM CONCURRENCY
+UPSTREAM_INITIAL_CONCURRENCY = 3
+UPSTREAM_MIN_CONCURRENCY = 1
+UPSTREAM_DECREASE_FACTOR = 0.5
+UPSTREAM_DECREASE_HOLDOFF = 5.0  # one throttling episode halves the limit once, not once per failed request
+UPSTREAM_BACKOFF_BASE = 2.0  # seconds
+UPSTREAM_BACKOFF_MAX = 120.0
+UPSTREAM_WAIT_POLL = 1.0  # waiting requests re-check their cancel flag this often
+
+# bot-detection markers plus the plain http refusals youtube throttles with
+THROTTLE_MARKERS = BOT_DETECTION_MARKERS + (
+    "HTTP Error 403",
+    "Too Many Requests",
+)
+
+def is_throttle_error(error_msg: str) -> bool:
+    return any(marker in error_msg for marker in THROTTLE_MARKERS)
+
+def jittered_backoff(strikes: int) -> float:
+    """exponential backoff with equal jitter, so retries from parallel jobs don't land together"""
+    delay = min(UPSTREAM_BACKOFF_MAX, UPSTREAM_BACKOFF_BASE * 2 ** max(0, strikes - 1))
+    return delay / 2 + random.uniform(0, delay / 2)
+
+def upstream_host(url: str) -> str:
+    host = (urlparse(url).hostname or "").lower()
+    for prefix in ("www.", "m.", "music."):
+        if host.startswith(prefix):
+            host = host[len(prefix):]
+    # youtu.be links and the media cdn are throttled as youtube
+    return "youtube.com" if host in ("youtu.be", "youtube-nocookie.com") else host
+
+class HostBackoff:
+    """throttling state shared by every lane of one host, a challenge on downloads pauses extraction too"""
+    def __init__(self):
+        self.strikes = 0  # throttling signals since the last success, drives the backoff
+        self.not_before = 0.0  # monotonic time before which no new request may start
+
+class AIMDLimiter:
+    """additive-increase / multiplicative-decrease concurrency limit for one lane of an upstream host.
+    grows by one slot per window of successes, halves and pauses the host on throttling signals"""
+    def __init__(self, host: str, lane: str, backoff: HostBackoff):
+        self.host = host
+        self.lane = lane
+        self.backoff = backoff
+        self.limit = float(min(UPSTREAM_INITIAL_CONCURRENCY, performance.upstream_max_concurrency))
+        self.in_flight = 0
+        self.waiting = 0
+        self.successes = 0
+        self.throttles = 0
+        self.last_decrease = 0.0
+        self._cond = asyncio.Condition()
+    
+    async def acquire(self, control: Optional[DownloadControl] = None):
+        async with self._cond:
+            self.waiting += 1
+            try:
+                while True:
+                    if control is not None:
+                        control.check()
+                    pause = self.backoff.not_before - time.monotonic()
+                    if pause <= 0 and self.in_flight < int(self.limit):
+                        self.in_flight += 1
+                        return
+                    try:
+                        timeout = min(pause, UPSTREAM_WAIT_POLL) if pause > 0 else UPSTREAM_WAIT_POLL
+                        await asyncio.wait_for(self._cond.wait(), timeout=timeout)
+                    except asyncio.TimeoutError:
+                        pass
+            finally:
+                self.waiting -= 1
+    
+    async def release(self, succeeded: bool, throttled: bool):
+        async with self._cond:
+            # only grow while the limit is what holds requests back, not while it sits unused
+            was_saturated = self.in_flight >= int(self.limit)
+            self.in_flight -= 1
+            now = time.monotonic()
+            if throttled:
+                self.throttles += 1
+                self.backoff.strikes += 1
+                if now - self.last_decrease >= UPSTREAM_DECREASE_HOLDOFF:
+                    self.limit = max(UPSTREAM_MIN_CONCURRENCY, self.limit * UPSTREAM_DECREASE_FACTOR)
+                    self.last_decrease = now
+                self.backoff.not_before = max(self.backoff.not_before, now + jittered_backoff(self.backoff.strikes))
+                print(f"upstream {self.host} ({self.lane}) throttled, limit {self.limit:.2f}, "
+                      f"pausing {self.backoff.not_before - now:.1f}s")
+            elif succeeded:
+                self.successes += 1
+                self.backoff.strikes = 0
+                if was_saturated or self.waiting:
+                    self.limit = min(performance.upstream_max_concurrency, self.limit + 1 / self.limit)
+            self._cond.notify_all()
+    
+    def stats(self) -> dict:
+        return {
+            "limit": round(self.limit, 2),
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "successes": self.successes,
+            "throttles": self.throttles,
+            "paused_for": round(max(0.0, self.backoff.not_before - time.monotonic()), 1),
+        }
+
+class UpstreamController:
+    """one limiter per (host, lane); long downloads get their own lane so they can't starve info lookups"""
+    def __init__(self):
+        self.limiters = {}
+        self.backoffs = {}
+    
+    def for_url(self, url: str, lane: str) -> AIMDLimiter:
+        host = upstream_host(url)
+        limiter = self.limiters.get((host, lane))
+        if limiter is None:
+            backoff = self.backoffs.setdefault(host, HostBackoff())
+            limiter = self.limiters[(host, lane)] = AIMDLimiter(host, lane, backoff)
+        return limiter
+    
+    def stats(self) -> dict:
+        return {f"{host}/{lane}": limiter.stats() for (host, lane), limiter in self.limiters.items()}
+
+upstream = UpstreamController()
+
+async def _run_with_cookie_health(func, url: str, opts: dict, lane: str = "extract"):
+    # every extraction and download passes through here: it waits for a slot from the host's
+    # concurrency limiter, feeds the outcome back to it and to the cookie pool, and retries
+    # throttled calls after a jittered pause with a fresh identity
+    limiter = upstream.for_url(url, lane)
+    control = current_download.get()
+    attempt = 0
+    while True:
+        cookiefile = opts.get('cookiefile')
+        await limiter.acquire(control)
+        try:
+            result = await run_in_executor_with_context(executor, func, url, opts)
+        except Exception as e:
+            if control is not None and control.cancelled:
+                await limiter.release(succeeded=False, throttled=False)
+                # a killed ffmpeg surfaces as a download error, neither says anything about the cookie
+                raise DownloadCancelled("Download cancelled") from e
+            throttled = is_throttle_error(str(e))
+            await limiter.release(succeeded=False, throttled=throttled)
+            cookie_manager.report_failure(cookiefile, str(e))
+            if not throttled or attempt >= performance.throttle_retries:
+                raise
+        else:
+            await limiter.release(succeeded=True, throttled=False)
+            cookie_manager.report_success(cookiefile)
+            return result
+        
+        attempt += 1
+        delay = jittered_backoff(attempt)
+        print(f"throttled by {limiter.host}, retry {attempt} in {delay:.1f}s")
+        await asyncio.sleep(delay)
+        if cookiefile:
+            opts = dict(opts)
+            fresh = cookie_manager.select_cookiefile()
+            if fresh:
+                opts['cookiefile'] = fresh
+
+async def extract_info_async(url: str, opts: dict) -> dict:
+    return await _run_with_cookie_health(_extract_info_blocking, url, opts)
+
+async def download_async(url: str, opts: dict) -> None:
+    return await _run_with_cookie_health(_download_blocking, url, opts, lane="download")
+
+def build_download_opts(base_opts: dict) -> dict:
+    """enhanced opts plus the progress hooks of the queued job and cancel flag in context"""
+    opts = get_enhanced_ydl_opts(base_opts)
+    report_progress = job_progress_hook.get()
+    if report_progress is not None:
+        opts['progress_hooks'] = list(opts.get('progress_hooks', [])) + [report_progress]
+    control = current_download.get()
+    if control is not None:
+        control.check()
+        opts['progress_hooks'] = list(opts.get('progress_hooks', [])) + [control.progress_hook]
+    return opts
+
+async def download_with_fallback(url: str, base_opts: dict) -> None:
+    """Download using yt-dlp's built-in retry mechanisms"""
+    # Let yt-dlp handle fallbacks automatically with its built-in retry system
+    await download_async(url, build_download_opts(base_opts))
+
+# PLAYER JS CACHE
+class CountingCache(dict):
+    """bounded dict that counts hits and misses, oldest entries are evicted first
+    
+    yt-dlp tests membership both before a lookup and before a store, so `in` can't tell them
+    apart. a hit is a value read back with [], a miss is a new key being stored (the player
+    was downloaded or the challenge solved because it wasn't there)
+    """
+    def __init__(self, max_size: int):
+        super().__init__()
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+    
+    def __getitem__(self, key):
+        value = super().__getitem__(key)
+        self.hits += 1
+        return value
+    
+    def __setitem__(self, key, value):
+        if not super().__contains__(key):
+            self.misses += 1
+        super().__setitem__(key, value)
+        self._evict()
+    
+    def resize(self, max_size: int):
+        self.max_size = max_size
+        self._evict()
+    
+    def _evict(self):
+        while len(self) > self.max_size:
+            try:
+                super().__delitem__(next(iter(self)))
+            except (StopIteration, KeyError, RuntimeError):
+                break
+
+class PlayerJSCache:
+    """player js and solved n/sig challenge results shared by every youtube extractor instance
+    
+    yt-dlp keeps these per extractor instance, keyed by player version, so sharing them means
+    a player is only downloaded and a challenge only solved in deno once per process.
+    signature functions are also persisted by yt-dlp itself under YDL_CACHE_DIR.
+    """
+    def __init__(self):
+        self.code = CountingCache(performance.player_code_cache_size)
+        self.results = CountingCache(performance.player_result_cache_size)
+        self.warmed_at = None
+    
+    def attach(self, ydl: yt_dlp.YoutubeDL):
+        try:
+            ie = ydl.get_info_extractor('Youtube')
+        except Exception:
+            return
+        # private yt-dlp attributes, skip quietly if a release renames them
+        if hasattr(ie, '_code_cache') and hasattr(ie, '_player_cache'):
+            ie._code_cache = self.code
+            ie._player_cache = self.results
+    
+    def stats(self) -> dict:
+        lookups = self.results.hits + self.results.misses
+        players = {key[1] for key in self.results.keys() if isinstance(key, tuple) and len(key) > 1}
+        return {
+            "cache_dir": str(YDL_CACHE_DIR),
+            "players_cached": len(self.code),
+            "player_versions": sorted(players),
+            "solved_results": len(self.results),
+            "hits": self.results.hits,
+            "misses": self.results.misses,
+            "hit_rate": round(self.results.hits / lookups, 3) if lookups else None,
+            "player_downloads": self.code.misses,
+            "warmed_at": self.warmed_at
+        }
+
+player_js_cache = PlayerJSCache()
+
+PLAYER_WARMUP_URL = "https://www.youtube.com/watch?v=dQw4w9WgXcQ"
+
+async def warm_player_js_cache():
+    """fetch the current player and solve its challenges once so real requests hit the cache"""
+    try:
+        await extract_info_async(PLAYER_WARMUP_URL, get_enhanced_ydl_opts())
+        player_js_cache.warmed_at = datetime.now().isoformat(timespec='seconds')
+    except Exception as e:
+        print(f"player js cache warmup failed: {e}")
+
+def create_ydl(opts: dict) -> yt_dlp.YoutubeDL:
+    """YoutubeDL that shares the cookie manager's parsed jar instead of re-reading the cookie file"""
+    jar = cookie_manager.get_jar(opts['cookiefile']) if opts.get('cookiefile') else None
+    if jar is None:
+        ydl = yt_dlp.YoutubeDL(opts)
+    else:
+        # without a cookiefile param yt-dlp neither loads nor writes back the file on close,
+        # the cookie manager saves the shared jar at shutdown instead
+        opts = {key: value for key, value in opts.items() if key != 'cookiefile'}
+        ydl = yt_dlp.YoutubeDL(opts)
+        ydl.__dict__['cookiejar'] = jar
+    player_js_cache.attach(ydl)
+    return ydl
+
+# options that differ per job; everything else decides which pooled instances are interchangeable
+YDL_CALL_OPTIONS = (
+    'outtmpl', 'format', 'download_ranges', 'force_keyframes_at_cuts',
+    'merge_output_format', 'restrictfilenames', 'playlist_items', 'extract_flat',
+    'progress_hooks',
+)
+YDL_POOL_IDLE_TIMEOUT = 600  # seconds
+
+class PooledYoutubeDL:
+    def __init__(self, ydl: yt_dlp.YoutubeDL, cookiefile: Optional[str]):
+        self.ydl = ydl
+        self.cookiefile = cookiefile
+        self.jar = ydl.__dict__.get('cookiejar')
+        # __init__ normalizes params in place, keep that result as the per-call starting point
+        self.base_params = dict(ydl.params)
+        self.returned_at = time.monotonic()
+    
+    def is_stale(self) -> bool:
+        if time.monotonic() - self.returned_at > YDL_POOL_IDLE_TIMEOUT:
+            return True
+        # the http stack holds the jar it was built with, a reloaded cookie file needs a new instance
+        if self.cookiefile and cookie_manager.get_jar(self.cookiefile) is not self.jar:
+            return True
+        return False
+    
+    def apply_call_opts(self, call_opts: dict):
+        ydl = self.ydl
+        params = {key: value for key, value in self.base_params.items() if key not in YDL_CALL_OPTIONS}
+        params.update(call_opts)
+        ydl.params = params
+        ydl._parse_outtmpl()
+        fmt = params.get('format')
+        ydl.format_selector = (
+            fmt if fmt in (None, '-')
+            else fmt if callable(fmt)
+            else ydl.build_format_selector(fmt))
+        ydl._progress_hooks = list(params.get('progress_hooks', []))
+        # per-run counters that YoutubeDL assumes start fresh
+        ydl._download_retcode = 0
+        ydl._num_downloads = 0
+        ydl._num_videos = 0
+        ydl._playlist_level = 0
+        ydl._playlist_urls = set()
+        ydl._printed_messages = set()
+    
+    def close(self):
+        try:
+            self.ydl.close()
+        except Exception:
+            pass
+
+class YoutubeDLPool:
+    """long-lived YoutubeDL instances grouped by session options
+    
+    reusing an instance skips extractor setup and keeps its http connections alive.
+    each instance is checked out by one job at a time.
+    """
+    def __init__(self):
+        self._idle = {}
+        self._lock = threading.Lock()
+        self.created = 0
+        self.reused = 0
+    
+    @staticmethod
+    def split_opts(opts: dict) -> tuple[str, dict, dict]:
+        session_opts = {key: value for key, value in opts.items() if key not in YDL_CALL_OPTIONS}
+        call_opts = {key: value for key, value in opts.items() if key in YDL_CALL_OPTIONS}
+        key = repr(sorted((name, repr(value)) for name, value in session_opts.items()))
+        return key, session_opts, call_opts
+    
+    def _checkout(self, key: str, session_opts: dict) -> PooledYoutubeDL:
+        while True:
+            with self._lock:
+                idle = self._idle.get(key)
+                pooled = idle.pop() if idle else None
+            if pooled is None:
+                break
+            if pooled.is_stale():
+                pooled.close()
+                continue
+            self.reused += 1
+            return pooled
+        
+        self.created += 1
+        return PooledYoutubeDL(create_ydl(session_opts), session_opts.get('cookiefile'))
+    
+    def _checkin(self, key: str, pooled: PooledYoutubeDL):
+        pooled.returned_at = time.monotonic()
+        evicted = []
+        with self._lock:
+            idle = self._idle.setdefault(key, [])
+            # one per executor worker
+            if len(idle) >= performance.executor_workers:
+                evicted.append(pooled)
+            else:
+                idle.append(pooled)
+            # drop the longest idle instances across all keys once over the global cap
+            while sum(len(items) for items in self._idle.values()) > performance.ydl_pool_max_idle:
+                oldest_key = min(
+                    (k for k, items in self._idle.items() if items),
+                    key=lambda k: self._idle[k][0].returned_at)
+                evicted.append(self._idle[oldest_key].pop(0))
+        for item in evicted:
+            item.close()
+    
+    @contextmanager
+    def acquire(self, opts: dict):
+        key, session_opts, call_opts = self.split_opts(opts)
+        pooled = self._checkout(key, session_opts)
+        pooled.apply_call_opts(call_opts)
+        try:
+            yield pooled.ydl
+        finally:
+            # drop references to the job's hooks and ranges before parking the instance
+            pooled.apply_call_opts({})
+            self._checkin(key, pooled)
+    
+    def warm(self, opts: dict, count: int = 1):
+        """pre-build instances with the youtube extractor and http stack initialized"""
+        key, session_opts, _ = self.split_opts(opts)
+        for _ in range(count):
+            self.created += 1
+            pooled = PooledYoutubeDL(create_ydl(session_opts), session_opts.get('cookiefile'))
+            pooled.ydl.get_info_extractor('Youtube')
+            pooled.ydl._request_director
+            self._checkin(key, pooled)
+    
+    def close(self):
+        with self._lock:
+            items = [pooled for idle in self._idle.values() for pooled in idle]
+            self._idle.clear()
+        for pooled in items:
+            pooled.close()
+    
+    def stats(self) -> dict:
+        with self._lock:
+            idle = sum(len(items) for items in self._idle.values())
+            groups = sum(1 for items in self._idle.values() if items)
+        return {
+            "idle": idle,
+            "groups": groups,
+            "created": self.created,
+            "reused": self.reused
+        }
+
+ydl_pool = YoutubeDLPool()
+
+def _extract_info_blocking(url: str, opts: dict) -> dict:
+    with ydl_pool.acquire(opts) as ydl:
+        return ydl.extract_info(url, download=False)
+
+def _download_blocking(url: str, opts: dict) -> None:
+    with ydl_pool.acquire(opts) as ydl:
+        ydl.download([url])
+
+async def extract_video_info_with_fallback(url: str) -> dict:
+    """Extract video info using yt-dlp's built-in retry mechanisms"""
+    # Let yt-dlp handle fallbacks automatically with its built-in retry system
+    opts = get_enhanced_ydl_opts()
+    return await extract_info_async(url, opts)
+
+_MISSING = object()
+
+class PlaylistEntry:
+    """the fields the playlist endpoints read from an entry, everything else in the info dict
+    (formats, thumbnails, captions, headers) is dropped as soon as the entry arrives.
+    read through get() like the info dict it replaces"""
+    __slots__ = ('id', 'title', 'duration', 'thumbnail', 'uploader', 'channel', 'video_formats', 'audio_formats')
+    
+    def __init__(self, info: dict):
+        for key in ('id', 'title', 'duration', 'thumbnail', 'uploader', 'channel'):
+            setattr(self, key, info.get(key, _MISSING))
+        self.video_formats = _MISSING
+        self.audio_formats = _MISSING
+    
+    def get(self, key: str, default=None):
+        value = getattr(self, key, _MISSING) if key in PlaylistEntry.__slots__ else _MISSING
+        return default if value is _MISSING else value
+    
+    @property
+    def url(self) -> str:
+        return f"https://www.youtube.com/watch?v={self.get('id', '')}"
+    
+    def add_formats(self, info: dict):
+        """reduce a full extraction to the menu entries the response shows"""
+        duration = info.get('duration')
+        if duration is not None:
+            self.duration = duration
+        video_formats, audio_formats = extract_formats(info.get('formats') or [], self.url, duration)
+        self.video_formats = [f.model_dump() for f in video_formats]
+        self.audio_formats = [f.model_dump() for f in audio_formats]
+
+async def add_entry_formats(entry: PlaylistEntry):
+    # one video at a time through the upstream limiter, its full info dict is released right after pruning
+    try:
+        info = await extract_info_async(entry.url, get_enhanced_ydl_opts())
+    except Exception as e:
+        if is_throttle_error(str(e)) or isinstance(e, DownloadCancelled):
+            raise
+        print(f"format lookup failed for playlist entry {entry.get('id')}: {e}")
+        return
+    entry.add_formats(info)
+
+async def add_playlist_formats(entries: List[PlaylistEntry]):
+    """format lookups for every entry; the first one to fail stops those still waiting for a slot"""
+    lookups = DownloadControl()
+    
+    async def lookup(entry: PlaylistEntry):
+        # each task runs in its own copy of the context, the limiter checks this control while waiting
+        current_download.set(lookups)
+        await add_entry_formats(entry)
+    
+    tasks = [asyncio.ensure_future(lookup(entry)) for entry in entries]
+    try:
+        await asyncio.gather(*tasks)
+    except Exception:
+        lookups.cancel()
+        # lookups already on an executor thread hold their slot until they finish, wait for them
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
+
+async def extract_playlist_info_with_fallback(url: str, max_videos: Optional[int] = None, include_formats: bool = False) -> dict:
+    """Extract playlist info using yt-dlp's built-in retry mechanisms"""
+    max_videos = min(max_videos or performance.playlist_default_videos, performance.playlist_max_videos)
+    # always list flat, formats are fetched per entry below so no more than a few
+    # full info dicts exist at once however long the playlist is
+    base_playlist_opts = {
+        'extract_flat': True,
+        'playlist_items': f'1:{max_videos}',
+    }
+    
+    try:
+        # Let yt-dlp handle fallbacks automatically with its built-in retry system
+        opts = get_enhanced_ydl_opts(base_playlist_opts)
+        info = await extract_info_async(url, opts)
+        playlist = {
+            'title': info.get('title'),
+            'id': info.get('id'),
+            'uploader': info.get('uploader'),
+            'channel': info.get('channel'),
+            'playlist_count': info.get('playlist_count'),
+            'entries': [PlaylistEntry(entry) for entry in info.get('entries') or [] if entry],
+        }
+        del info
+        if include_formats:
+            await add_playlist_formats(playlist['entries'])
+        return playlist
+    except Exception as e:
+        error_msg = str(e)
+        # Still handle the specific cookie-related error for playlists
+        if is_bot_detection_error(error_msg) and not cookie_manager.has_valid_cookies():
+            raise HTTPException(
+                status_code=503,
+                detail={
+                    "error": "YouTube bot detection triggered for playlist",
+                    "message": "Server needs YouTube cookies to access playlists",
+                    "has_cookies": False,
+                    "solution": "Admin needs to update server cookies"
+                }
+            )
+        raise e
+
+def _nan_to_none(value):
+    if isinstance(value, float):
+        return value if math.isfinite(value) else None
+    if isinstance(value, dict):
+        return {key: _nan_to_none(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_nan_to_none(item) for item in value]
+    return value
+
+def dumps_json(content) -> bytes:
+    """compact json bytes, through orjson when it is installed"""
+    if orjson is not None:
+        return orjson.dumps(content)
+    try:
+        return json.dumps(content, ensure_ascii=False, allow_nan=False, separators=(',', ':')).encode('utf-8')
+    except ValueError:
+        # orjson writes nan and inf as null, the payload must not depend on which encoder is installed
+        return json.dumps(_nan_to_none(content), ensure_ascii=False, allow_nan=False,
+                          separators=(',', ':')).encode('utf-8')
+
+class FastJSONResponse(Response):
+    """json response for plain dicts/lists that skips fastapi's response model validation and encoder"""
+    media_type = "application/json"
+    
+    def render(self, content) -> bytes:
+        return dumps_json(content)
+
+def playlist_entry_records(entries: List[PlaylistEntry]) -> List[dict]:
+    """entries as plain dicts shaped like PlaylistVideoInfo, built without a model per entry"""
+    videos = []
+    
+    for i, entry in enumerate(entries):
+        if not entry:
+            continue
+        title = entry.get('title', f'Video {i+1}')
+        uploader = entry.get('uploader', entry.get('channel', 'Unknown'))
+        # deleted and private videos come back without these, the response has always left them out
+        if title is None or uploader is None:
+            continue
+        try:
+            video_id = entry.get('id') or ''
+            duration = entry.get('duration')
+            duration = int(duration) if duration is not None else None
+            video_url = f"https://www.youtube.com/watch?v={video_id}"
+            
+            # only filled in when formats were requested
+            video_formats = entry.get('video_formats') or []
+            audio_formats = entry.get('audio_formats') or []
+            
+            videos.append({
+                "video_id": video_id,
+                "title": title,
+                "duration": duration,
+                "duration_string": format_duration(duration),
+                "thumbnail": entry.get('thumbnail'),
+                "uploader": uploader,
+                "index": i,
+                "url": video_url,
+                "video_formats": video_formats,
+                "audio_formats": audio_formats
+            })
+        except Exception:
+            continue
+    
+    return videos
+
+@app.get("/", include_in_schema=False)
+async def root():
+    """Basic status endpoint with download awareness"""
+    return {
+        "message": "Cliply Desktop Server",
+        "version": "1.0.0",
+        "status": "running",
+        "active_downloads": len(active_downloads),
+        "loop_lag_ms": loop_monitor.snapshot()["current_lag_ms"],
+        "downloads_directory": str(get_downloads_directory()),
+        "cookies": cookie_manager.has_valid_cookies(),
+        "ffmpeg_available": FFMPEG_PATH is not None,
+        "ffmpeg_path": str(FFMPEG_PATH) if FFMPEG_PATH else None,
+        "deno_available": DENO_PATH is not None,
+        "deno_path": str(DENO_PATH) if DENO_PATH else None
+    }
+
+@app.get("/docs", response_class=HTMLResponse, include_in_schema=False)
+async def get_docs():
+    """API documentation"""
+    return get_swagger_ui_html(
+        openapi_url="/openapi.json",
+        title=app.title + " - API Documentation",
+        swagger_favicon_url="/favicon.ico"
+    )
+
+@app.get("/openapi.json", include_in_schema=False)
+async def get_openapi():
+    """OpenAPI schema"""
+    return app.openapi()
+
+
+@app.post("/api/video/info", response_model=VideoInfoResponse)
+async def get_video_info(request: VideoInfoRequest):
+    """Get video information with format details"""
+    try:
+        info = await extract_video_info_with_fallback(request.url)
+        video_formats, audio_formats = extract_formats(
+            info.get('formats', []), request.url, info.get('duration'), request.time_range
+        )
+        
+        return VideoInfoResponse(
+            title=info.get('title', 'Unknown'),
+            duration=info.get('duration', 0),
+            duration_string=format_duration(info.get('duration', 0)),
+            thumbnail=info.get('thumbnail'),
+            uploader=info.get('uploader', 'Unknown'),
+            video_formats=video_formats,
+            audio_formats=audio_formats
+        )
+        
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Failed to get video info: {str(e)}")
+
+def locate_output_file(directory: Path, base_name: str, extensions: List[str], fallback_extensions: List[str],
+                       missing_detail: str) -> tuple:
+    """finished output of a download and its size, globs and stats so run it off the loop"""
+    # More robust file detection - check for files with the expected base name
+    possible_files = []
+    
+    # Look for files with the exact base name and common extensions
+    for ext in extensions:
+        possible_files.extend(directory.glob(f"{base_name}.{ext}"))
+    
+    # If no exact matches, fall back to generic search (most recent file)
+    if not possible_files:
+        all_files = [f for ext in fallback_extensions for f in directory.glob(f"*.{ext}")]
+        if all_files:
+            # Get the most recently created file
+            possible_files = [max(all_files, key=lambda x: x.stat().st_mtime)]
+    
+    if not possible_files:
+        raise HTTPException(status_code=500, detail=missing_detail)
+    
+    # Use the most recent file if multiple matches
+    actual_file = max(possible_files, key=lambda x: x.stat().st_mtime)
+    
+    # ensure file is completely written before getting size
+    try:
+        actual_file_size = actual_file.stat().st_size
+        if actual_file_size == 0:
+            raise HTTPException(status_code=500, detail="Download failed - file is empty")
+    except OSError as e:
+        raise HTTPException(status_code=500, detail=f"Download failed - cannot access file: {str(e)}")
+    return actual_file, actual_file_size
+
+def list_prefixed_files(directory: Path, prefix: str) -> List[Path]:
+    return [f for f in directory.iterdir() if f.name.startswith(prefix) and f.is_file()]
+
+@app.post("/api/video/download-combined")
+async def download_combined_video_audio(request: CombinedDownloadRequest, http_request: Request = None):
+    """download and merge video+audio with optional time range"""
+    if JOB_QUEUE_MODE:
+        return await run_queued_job("combined", request, http_request)
+    download_id = str(uuid.uuid4())
+    base_name = None
+    
+    try:
+
+        control = begin_download(download_id, {
+            "type": "combined",
+            "url": request.url,
+            "started": time.time()
+        }, http_request)
+        
+        info = await extract_video_info_with_fallback(request.url)
+        control.check()
+        title = sanitize_filename(info.get('title', 'video'))
+        
+
+        quality = get_quality_label(request.video_format_id)
+        timestamp = int(time.time() * 1000) % 100000
         
         if request.time_range:
             start_str = seconds_to_time_string(request.time_range.start)
@@ -665,355 +2432,1914 @@ async def download_combined_video_audio(request: CombinedDownloadRequest):
         final_path = get_downloads_directory() / final_filename
         
 
-        format_string = get_format_selector(request.video_format_id, request.audio_format_id)
-        
-        base_opts = {
-            'outtmpl': str(final_path),
-            'merge_output_format': 'mp4',
+        use_smart_cut = bool(request.time_range and request.precise_cut and request.smart_cut and can_smart_cut())
+        format_string = select_format_string(
+            info, request.video_format_id, request.audio_format_id,
+            prefer_vcodec='avc1' if use_smart_cut else None
+        )
+        
+        base_opts = {
+            'outtmpl': str(final_path),
+            'merge_output_format': 'mp4',
+        }
+        
+
+        if format_string is not None:
+            base_opts['format'] = format_string
+        
+        base_name = final_filename.replace('.%(ext)s', '')
+        
+        # time ranges already go through ffmpeg reading the urls directly
+        use_streaming_merge = not request.time_range and can_stream_merge(info, format_string)
+        
+        await disk_admission.reserve(
+            download_id,
+            estimate_video_job_peak(info, request.video_format_id, request.audio_format_id, request.time_range,
+                                    use_smart_cut, use_streaming_merge),
+            get_downloads_directory()
+        )
+        
+        if use_smart_cut:
+            # the keyframe-snapped range lands next to the final file and is cut into it afterwards
+            base_opts['outtmpl'] = str(get_downloads_directory() / f"{base_name}.uncut.%(ext)s")
+            base_opts = get_ydl_opts_for_smart_cut(base_opts, request.time_range)
+        else:
+            base_opts = get_ydl_opts_with_time_range(base_opts, request.time_range, request.precise_cut)
+        
+        base_opts['progress_hooks'] = [track_download_progress(download_id, get_downloads_directory(), base_name)]
+        downloaded = False
+        if use_streaming_merge:
+            try:
+                await download_with_fallback(request.url, get_ydl_opts_for_streaming_merge(dict(base_opts)))
+                downloaded = True
+            except Exception as e:
+                if control.cancelled or is_throttle_error(str(e)):
+                    raise
+                # e.g. ffmpeg dropped a connection mid-stream, redo it the file-based way
+                print(f"streaming merge failed, retrying with separate files: {e}")
+                remove_partial_files(get_downloads_directory(), base_name)
+                disk_admission.release(download_id)
+                await disk_admission.reserve(
+                    download_id,
+                    estimate_video_job_peak(info, request.video_format_id, request.audio_format_id, None),
+                    get_downloads_directory()
+                )
+        
+        # ranged downloads already read both streams at once through ffmpeg
+        if not downloaded and not request.time_range and can_fetch_components_in_parallel(info, format_string):
+            try:
+                await download_components_parallel(
+                    request.url, info, base_opts, format_string, get_downloads_directory(), base_name
+                )
+                downloaded = True
+            except Exception as e:
+                if control.cancelled or is_throttle_error(str(e)):
+                    raise
+                # the concrete pair didn't work out, let yt-dlp walk the whole selector
+                print(f"parallel component fetch failed, retrying sequentially: {e}")
+                remove_partial_files(get_downloads_directory(), base_name)
+        
+        if not downloaded:
+            await download_with_fallback(request.url, base_opts)
+        
+        control.check()
+        if use_smart_cut:
+            uncut_files = await asyncio.get_event_loop().run_in_executor(
+                None, list_prefixed_files, get_downloads_directory(), f"{base_name}.uncut."
+            )
+            if not uncut_files:
+                raise HTTPException(status_code=500, detail="Download failed - no files found in directory")
+            try:
+                await smart_cut_async(
+                    uncut_files[0],
+                    get_downloads_directory() / f"{base_name}.mp4",
+                    request.time_range.end - request.time_range.start
+                )
+            finally:
+                for f in uncut_files:
+                    f.unlink(missing_ok=True)
+        
+        actual_file, actual_file_size = await asyncio.get_event_loop().run_in_executor(
+            None, locate_output_file, get_downloads_directory(), base_name,
+            ['mp4', 'm4a', 'webm', 'mkv', 'mov', 'avi'], ['mp4', 'm4a', 'webm', 'mkv'],
+            "Download failed - no files found in directory"
+        )
+        
+        end_download(download_id)
+        disk_admission.release(download_id)
+        
+        return JSONResponse({
+            "success": True,
+            "filename": actual_file.name,
+            "file_path": str(actual_file),
+            "file_size": actual_file_size,
+            "download_id": download_id
+        })
+        
+    except Exception as e:
+        end_download(download_id)
+        disk_admission.release(download_id)
+        if control.cancelled:
+            remove_partial_files(get_downloads_directory(), base_name)
+            raise HTTPException(status_code=CANCELLED_STATUS_CODE, detail="Download cancelled")
+        if isinstance(e, InsufficientDiskSpace):
+            raise HTTPException(status_code=INSUFFICIENT_STORAGE_STATUS_CODE, detail=str(e))
+        raise HTTPException(status_code=500, detail=f"Combined download failed: {str(e)}")
+
+@app.post("/api/audio/download")
+async def download_audio_only(request: AudioDownloadRequest, http_request: Request = None):
+    """Download audio-only with optional time range"""
+    if JOB_QUEUE_MODE:
+        return await run_queued_job("audio", request, http_request)
+    # before the try, whose except would turn the 400 into a 500
+    if request.target_codec and not FFMPEG_PATH:
+        raise HTTPException(status_code=400, detail="ffmpeg is required to convert audio")
+    download_id = str(uuid.uuid4())
+    base_name = None
+    
+    try:
+        # Track active download
+        control = begin_download(download_id, {
+            "type": "audio",
+            "url": request.url,
+            "started": time.time()
+        }, http_request)
+        
+        info = await extract_video_info_with_fallback(request.url)
+        control.check()
+        title = sanitize_filename(info.get('title', 'audio'))
+        
+        # Create unique filename including quality info
+        quality = request.format_id.replace('_audio', '').replace('auto_audio', 'auto').replace('high_audio', 'high').replace('medium_audio', 'medium')
+        timestamp = int(time.time() * 1000) % 100000
+        
+        if request.time_range:
+            start_str = seconds_to_time_string(request.time_range.start)
+            end_str = seconds_to_time_string(request.time_range.end)
+            final_filename = f"{title}_audio_{quality}_trimmed_{start_str}-{end_str}_{timestamp}.%(ext)s".replace(':', '-')
+        else:
+            final_filename = f"{title}_audio_{quality}_{timestamp}.%(ext)s"
+        
+        final_path = get_downloads_directory() / final_filename
+        base_name = final_filename.replace('.%(ext)s', '')
+        
+        # Use yt-dlp audio format selector
+        format_string = select_audio_format_string(info, request.format_id)
+        base_opts = {
+            'format': format_string,
+            'outtmpl': str(final_path),
+        }
+        
+        base_opts = get_ydl_opts_with_time_range(base_opts, request.time_range, request.precise_cut)
+        
+        await disk_admission.reserve(
+            download_id,
+            estimate_audio_job_peak(info, request.format_id, request.time_range, request.target_codec),
+            get_downloads_directory()
+        )
+        
+        base_opts['progress_hooks'] = [track_download_progress(download_id, get_downloads_directory(), base_name)]
+        await download_with_fallback(request.url, base_opts)
+        
+        control.check()
+        
+        actual_file, actual_file_size = await asyncio.get_event_loop().run_in_executor(
+            None, locate_output_file, get_downloads_directory(), base_name,
+            ['m4a', 'mp3', 'webm', 'ogg', 'wav', 'aac'], ['m4a', 'mp3', 'webm', 'ogg'],
+            "Download failed - no audio files found in directory"
+        )
+        
+        if request.target_codec:
+            actual_file = await transcode_audio_async(actual_file, request.target_codec)
+            actual_file_size = await asyncio.get_event_loop().run_in_executor(None, lambda: actual_file.stat().st_size)
+        
+        end_download(download_id)
+        disk_admission.release(download_id)
+        
+        return JSONResponse({
+            "success": True,
+            "filename": actual_file.name,
+            "file_path": str(actual_file),
+            "file_size": actual_file_size,
+            "download_id": download_id
+        })
+        
+    except Exception as e:
+        end_download(download_id)
+        disk_admission.release(download_id)
+        if control.cancelled:
+            remove_partial_files(get_downloads_directory(), base_name)
+            raise HTTPException(status_code=CANCELLED_STATUS_CODE, detail="Download cancelled")
+        if isinstance(e, InsufficientDiskSpace):
+            raise HTTPException(status_code=INSUFFICIENT_STORAGE_STATUS_CODE, detail=str(e))
+        raise HTTPException(status_code=500, detail=f"Audio download failed: {str(e)}")
+
+# PLAYLIST ENDPOINTS
+@app.post("/api/playlist/info", response_model=PlaylistInfoResponse)
+async def get_playlist_info(request: PlaylistInfoRequest):
+    """Get playlist information with video list"""
+    try:
+        # Extract playlist info
+        info = await extract_playlist_info_with_fallback(
+            request.url, 
+            request.max_videos, 
+            request.include_formats
+        )
+        
+        # Get playlist metadata
+        playlist_title = info.get('title') or 'Unknown Playlist'
+        playlist_id = info.get('id', '')
+        uploader = info.get('uploader') or info.get('channel') or 'Unknown'
+        total_videos = info.get('playlist_count') or 0
+        entries = info.get('entries') or []
+        
+        # large playlists skip a pydantic model per entry and the default encoder,
+        # the response keeps the PlaylistInfoResponse shape (see benchmark_playlist_json.py)
+        videos = playlist_entry_records(entries)
+        
+        return FastJSONResponse({
+            "playlist_title": playlist_title,
+            "playlist_id": playlist_id,
+            "uploader": uploader,
+            "total_videos": total_videos,
+            "extracted_videos": len(videos),
+            "videos": videos
+        })
+        
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Failed to get playlist info: {str(e)}")
+
+async def download_entry_to_dir(video_id: str, output_filename: str, batch_dir: Path,
+                                video_format_id: Optional[str], audio_format_id: str,
+                                newest_fallback: bool = True) -> List[Path]:
+    """download one playlist entry into batch_dir, returns the matching file(s)"""
+    video_url = f"https://www.youtube.com/watch?v={video_id}"
+    
+    if video_format_id:
+        format_string = get_format_selector(video_format_id, audio_format_id)
+        file_ext = "mp4"
+    else:
+        format_string = get_audio_format_selector(audio_format_id)
+        file_ext = "m4a"
+    
+    output_path = batch_dir / f"{output_filename}.%(ext)s"
+    
+    base_opts = {
+        'outtmpl': str(output_path),
+        'merge_output_format': file_ext,
+        'restrictfilenames': True,
+    }
+    
+    # Only add format if not using yt-dlp default (auto)
+    if format_string is not None:
+        base_opts['format'] = format_string
+    
+    await download_with_fallback(video_url, base_opts)
+    return await asyncio.get_event_loop().run_in_executor(
+        None, find_entry_files, batch_dir, output_filename, video_id, newest_fallback
+    )
+
+def find_entry_files(batch_dir: Path, output_filename: str, video_id: str, newest_fallback: bool) -> List[Path]:
+    downloaded_file = list(batch_dir.glob(f"{output_filename}.*"))
+    
+    if not downloaded_file:
+        downloaded_file = list(batch_dir.glob(f"*{output_filename}*"))
+    
+    if not downloaded_file:
+        downloaded_file = list(batch_dir.glob(f"*{video_id}*"))
+    
+    if not downloaded_file and newest_fallback:
+        all_files = list(batch_dir.glob("*"))
+        if all_files:
+            downloaded_file = [max(all_files, key=os.path.getctime)]
+    
+    return downloaded_file
+
+def write_zip_archive(zip_path: Path, files: List[Path]):
+    """deflating a batch takes seconds, runs on the executor"""
+    control = current_download.get()
+    with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
+        for file_path in files:
+            if control is not None:
+                control.check()
+            zipf.write(file_path, file_path.name)
+
+def remove_batch_dir(batch_dir: Path):
+    try:
+        if batch_dir.exists():
+            for file in batch_dir.glob("*"):
+                file.unlink()
+            batch_dir.rmdir()
+    except:
+        pass
+
+async def release_disk_reservation(job_id: str):
+    # runs as a background task once the response file has been sent and cleaned up
+    disk_admission.release(job_id)
+
+@app.post("/api/playlist/download")
+async def download_playlist_videos(request: PlaylistDownloadRequest, background_tasks: BackgroundTasks,
+                                  http_request: Request = None):
+    """Download selected videos from playlist"""
+    # audio conversions run on the transcode pool while later videos keep downloading
+    transcode_codec = request.target_codec if not request.video_format_id else None
+    if transcode_codec and not FFMPEG_PATH:
+        raise HTTPException(status_code=400, detail="ffmpeg is required to convert audio")
+    download_id = str(uuid.uuid4())
+    try:
+        control = begin_download(download_id, {
+            "type": "playlist",
+            "url": request.url,
+            "started": time.time()
+        }, http_request)
+        
+        # First, get playlist info to validate selected videos
+        playlist_info = await extract_playlist_info_with_fallback(request.url, max_videos=performance.playlist_max_videos)
+        entries = playlist_info.get('entries', [])
+        
+        if not entries:
+            raise HTTPException(status_code=400, detail="No videos found in playlist")
+        
+        max_index = len(entries) - 1
+        invalid_indices = [i for i in request.selected_videos if i > max_index or i < 0]
+        if invalid_indices:
+            raise HTTPException(
+                status_code=400, 
+                detail=f"Invalid video indices: {invalid_indices}. Playlist has {len(entries)} videos (indices 0-{max_index})"
+            )
+        
+        batch_dir = get_downloads_directory() / f"playlist_{download_id}"
+        batch_dir.mkdir(exist_ok=True)
+        
+        downloaded_files = []
+        failed_downloads = []
+        
+        transcode_jobs = []
+        
+        selected_entries = [entries[i] for i in request.selected_videos]
+        await disk_admission.reserve(
+            download_id,
+            estimate_batch_peak(selected_entries, request.video_format_id, transcode_codec, zipped=True),
+            get_downloads_directory()
+        )
+        
+        for video_index in request.selected_videos:
+            control.check()
+            try:
+                entry = entries[video_index]
+                video_id = entry.get('id', '')
+                video_title = sanitize_filename(entry.get('title', f'video_{video_index}'))
+                
+                safe_video_title = re.sub(r'[^\w\s-]', '', video_title)[:100]
+                output_filename = f"{video_index:03d}_{safe_video_title}"
+                
+                downloaded_file = await download_entry_to_dir(
+                    video_id, output_filename, batch_dir,
+                    request.video_format_id, request.audio_format_id
+                )
+                
+                if downloaded_file and transcode_codec:
+                    transcode_jobs.append((
+                        video_index,
+                        asyncio.ensure_future(transcode_audio_async(downloaded_file[0], transcode_codec))
+                    ))
+                elif downloaded_file:
+                    downloaded_files.append(downloaded_file[0])
+                else:
+                    failed_downloads.append(f"Video {video_index}: {video_title}")
+                
+            except Exception as e:
+                if control.cancelled:
+                    raise
+                failed_downloads.append(f"Video {video_index}: {str(e)}")
+                continue
+        
+        for video_index, job in transcode_jobs:
+            try:
+                downloaded_files.append(await job)
+            except Exception as e:
+                failed_downloads.append(f"Video {video_index}: conversion failed: {str(e)}")
+        control.check()
+        
+        if not downloaded_files:
+            try:
+                batch_dir.rmdir()
+            except:
+                pass
+            raise HTTPException(status_code=500, detail="No videos were successfully downloaded")
+        
+        if len(downloaded_files) == 1:
+            file_path = downloaded_files[0]
+            playlist_title = sanitize_filename(playlist_info.get('title', 'playlist'))
+            
+            def cleanup():
+                try:
+                    file_path.unlink(missing_ok=True)
+                    batch_dir.rmdir()
+                except:
+                    pass
+            
+            background_tasks.add_task(cleanup)
+            background_tasks.add_task(release_disk_reservation, download_id)
+            end_download(download_id)
+            
+            return FileResponse(
+                path=str(file_path),
+                filename=f"{playlist_title}_{file_path.name}",
+                media_type='application/octet-stream'
+            )
+        
+        else:
+            playlist_title = sanitize_filename(playlist_info.get('title', 'playlist'))
+            archive_name = request.archive_name or f"{playlist_title}_videos"
+            zip_path = batch_dir.parent / f"{download_id}_{archive_name}.zip"
+            
+            try:
+                await run_in_executor_with_context(executor, write_zip_archive, zip_path, downloaded_files)
+            except Exception:
+                zip_path.unlink(missing_ok=True)
+                raise
+            
+            def cleanup():
+                try:
+                    for file_path in downloaded_files:
+                        file_path.unlink(missing_ok=True)
+                    batch_dir.rmdir()
+                    zip_path.unlink(missing_ok=True)
+                except:
+                    pass
+            
+            background_tasks.add_task(cleanup)
+            background_tasks.add_task(release_disk_reservation, download_id)
+            end_download(download_id)
+            
+            return FileResponse(
+                path=str(zip_path),
+                filename=f"{archive_name}.zip",
+                media_type='application/zip'
+            )
+        
+    except Exception as e:
+        end_download(download_id)
+        disk_admission.release(download_id)
+        await asyncio.get_event_loop().run_in_executor(
+            None, remove_batch_dir, get_downloads_directory() / f"playlist_{download_id}"
+        )
+        if control.cancelled:
+            raise HTTPException(status_code=CANCELLED_STATUS_CODE, detail="Download cancelled")
+        if isinstance(e, InsufficientDiskSpace):
+            raise HTTPException(status_code=INSUFFICIENT_STORAGE_STATUS_CODE, detail=str(e))
+        raise HTTPException(status_code=500, detail=f"Playlist download failed: {str(e)}")
+
+# PLAYLIST SYNC
+SYNC_RETRY_LIMIT = 5  # syncs that retry a failed video before it is left in the archive as failed
+
+# one sync per archive at a time, each saves the whole archive it loaded
+sync_locks = {}
+
+class DownloadArchive:
+    """video ids already synced for one playlist, and the formats they were fetched in"""
+    def __init__(self, playlist_id: str):
+        self.playlist_id = playlist_id
+        safe_id = re.sub(r'[^\w-]', '_', playlist_id)
+        self.path = get_archives_directory() / f"{safe_id}.json"
+        self.data = {"playlist_id": playlist_id, "directory": None, "videos": {}}
+        try:
+            if self.path.exists():
+                with open(self.path, 'r') as f:
+                    self.data.update(json.load(f))
+        except Exception as e:
+            print(f"failed to load download archive {self.path.name}: {e}")
+    
+    @property
+    def videos(self) -> dict:
+        return self.data["videos"]
+    
+    def known_ids(self, format_key: str) -> set:
+        return {video_id for video_id, record in self.videos.items() if format_key in record.get("formats", {})}
+    
+    def add(self, video_id: str, format_key: str, filename: str):
+        record = self.videos.setdefault(video_id, {"formats": {}})
+        record["formats"][format_key] = {
+            "filename": filename,
+            "synced_at": datetime.now().isoformat(timespec='seconds')
         }
-        
+        self.pending(format_key).pop(video_id, None)
+    
+    def pending(self, format_key: str) -> dict:
+        """videos a sync found but failed to fetch, a newest-first walk won't reach them again"""
+        return self.data.setdefault("pending", {}).setdefault(format_key, {})
+    
+    def mark_failed(self, entry: dict, format_key: str, error: str):
+        record = self.pending(format_key).setdefault(entry['id'], {
+            "title": entry.get('title'),
+            "duration": entry.get('duration'),
+            "attempts": 0
+        })
+        record["attempts"] += 1
+        record["error"] = error
+    
+    def retry_entries(self, format_key: str) -> List[dict]:
+        return [{"id": video_id, "title": record.get("title"), "duration": record.get("duration")}
+                for video_id, record in self.pending(format_key).items()
+                if record["attempts"] < SYNC_RETRY_LIMIT]
+    
+    def has_gap(self, format_key: str) -> bool:
+        """a walk was cut off by max_new before it reached the synced videos"""
+        return format_key in self.data.get("gaps", [])
+    
+    def set_gap(self, format_key: str, gap: bool):
+        gaps = set(self.data.get("gaps", []))
+        if gap:
+            gaps.add(format_key)
+        else:
+            gaps.discard(format_key)
+        self.data["gaps"] = sorted(gaps)
+    
+    def save(self):
+        # write then rename so a crash mid-save never leaves a truncated archive
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_suffix('.json.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump(self.data, f, indent=2)
+        os.replace(tmp_path, self.path)
 
-        if format_string is not None:
-            base_opts['format'] = format_string
-        
-        base_opts = get_ydl_opts_with_time_range(base_opts, request.time_range, request.precise_cut)
-        
-        await download_with_fallback(request.url, base_opts)
-        
-        # More robust file detection - check for files with the expected base name
-        base_name = final_filename.replace('.%(ext)s', '')
-        possible_files = []
-        
-        # Look for files with the exact base name and common extensions
-        for ext in ['mp4', 'm4a', 'webm', 'mkv', 'mov', 'avi']:
-            pattern = f"{base_name}.{ext}"
-            matches = list(get_downloads_directory().glob(pattern))
-            possible_files.extend(matches)
-        
-        # If no exact matches, fall back to generic search (most recent file)
-        if not possible_files:
-            downloads_dir = get_downloads_directory()
-            all_files = list(downloads_dir.glob("*.mp4")) + list(downloads_dir.glob("*.m4a")) + list(downloads_dir.glob("*.webm")) + list(downloads_dir.glob("*.mkv"))
-            if all_files:
-                # Get the most recently created file
-                possible_files = [max(all_files, key=lambda x: x.stat().st_mtime)]
-        
-        if not possible_files:
-            raise HTTPException(status_code=500, detail="Download failed - no files found in directory")
-        
-        # Use the most recent file if multiple matches
-        actual_file = max(possible_files, key=lambda x: x.stat().st_mtime)
+def get_sync_format_key(video_format_id: Optional[str], audio_format_id: str, target_codec: Optional[str]) -> str:
+    key = f"{video_format_id or 'audio'}+{audio_format_id}"
+    if target_codec and not video_format_id:
+        key += f">{target_codec}"
+    return key
+
+def is_newest_first_url(url: str) -> bool:
+    return not re.search(r'[?&]list=', url)
+
+def _enumerate_new_entries_blocking(url: str, opts: dict, format_key: str, stop_at_known: Optional[bool],
+                                    max_new: int) -> dict:
+    """walk the playlist lazily, stopping at the first known video for newest-first sources
+    
+    videos older than the first known one are only all synced if no earlier walk was cut off
+    by max_new, otherwise the walk skips known videos until it has been through the whole list
+    """
+    with ydl_pool.acquire(opts) as ydl:
+        info = ydl.extract_info(url, download=False, process=False)
+        # channel urls resolve to their videos tab through a url result
+        for _ in range(3):
+            if info.get('_type') not in ('url', 'url_transparent'):
+                break
+            info = ydl.extract_info(info['url'], download=False, process=False)
         
-        # ensure file is completely written before getting size
-        try:
-            actual_file_size = actual_file.stat().st_size
-            if actual_file_size == 0:
-                raise HTTPException(status_code=500, detail="Download failed - file is empty")
-        except OSError as e:
-            raise HTTPException(status_code=500, detail=f"Download failed - cannot access file: {str(e)}")
+        playlist_id = info.get('id') or url
+        archive = DownloadArchive(playlist_id)
+        known = archive.known_ids(format_key)
+        # failed videos are retried from the archive, not picked up by the walk
+        retries = archive.retry_entries(format_key)
+        skip = known | set(archive.pending(format_key))
+        if stop_at_known is None:
+            stop_at_known = is_newest_first_url(url)
+        gap = archive.has_gap(format_key)
         
-        active_downloads.pop(download_id, None)
+        new_entries = []
+        examined = 0
+        stopped_early = False
+        cut_off = False
+        for entry in info.get('entries') or []:
+            if not entry or not entry.get('id'):
+                continue
+            examined += 1
+            if entry['id'] in skip:
+                if stop_at_known and not gap and entry['id'] in known:
+                    stopped_early = True
+                    break
+                continue
+            if len(new_entries) >= max_new:
+                cut_off = True
+                break
+            new_entries.append(entry)
         
-        return JSONResponse({
-            "success": True,
-            "filename": actual_file.name,
-            "file_path": str(actual_file),
-            "file_size": actual_file_size,
-            "download_id": download_id
-        })
+        if stop_at_known and (cut_off or not stopped_early):
+            # reaching the end of the list closes the gap, another cut-off keeps it open
+            archive.set_gap(format_key, cut_off)
         
-    except Exception as e:
-        active_downloads.pop(download_id, None)
-        raise HTTPException(status_code=500, detail=f"Combined download failed: {str(e)}")
+        return {
+            "archive": archive,
+            "playlist_title": info.get('title', 'Unknown Playlist'),
+            "entries": new_entries,
+            "retries": retries,
+            "examined": examined,
+            "stopped_early": stopped_early
+        }
 
-@app.post("/api/audio/download")
-async def download_audio_only(request: AudioDownloadRequest):
-    """Download audio-only with optional time range"""
-    download_id = str(uuid.uuid4())
-    
+@app.post("/api/playlist/sync")
+async def sync_playlist(request: PlaylistSyncRequest, http_request: Request = None):
+    """download only the playlist/channel videos not fetched by earlier syncs"""
+    if JOB_QUEUE_MODE:
+        return await run_queued_job("sync", request, http_request)
+    sync_id = f"sync_{uuid.uuid4()}"
+    archive = None
+    held_lock = None
     try:
-        # Track active download
-        active_downloads[download_id] = {
-            "type": "audio",
+        control = begin_download(sync_id, {
+            "type": "sync",
             "url": request.url,
             "started": time.time()
-        }
-        
-        info = await extract_video_info_with_fallback(request.url)
-        title = sanitize_filename(info.get('title', 'audio'))
-        
-        # Create unique filename including quality info
-        quality = request.format_id.replace('_audio', '').replace('auto_audio', 'auto').replace('high_audio', 'high').replace('medium_audio', 'medium')
-        timestamp = int(time.time() * 1000) % 100000
-        
-        if request.time_range:
-            start_str = seconds_to_time_string(request.time_range.start)
-            end_str = seconds_to_time_string(request.time_range.end)
-            final_filename = f"{title}_audio_{quality}_trimmed_{start_str}-{end_str}_{timestamp}.%(ext)s".replace(':', '-')
-        else:
-            final_filename = f"{title}_audio_{quality}_{timestamp}.%(ext)s"
-        
-        final_path = get_downloads_directory() / final_filename
+        }, http_request)
+        if request.target_codec and not request.video_format_id and not FFMPEG_PATH:
+            raise HTTPException(status_code=400, detail="ffmpeg is required to convert audio")
         
-        # Use yt-dlp audio format selector
-        format_string = get_audio_format_selector(request.format_id)
-        base_opts = {
-            'format': format_string,
-            'outtmpl': str(final_path),
-        }
+        format_key = get_sync_format_key(request.video_format_id, request.audio_format_id, request.target_codec)
+        opts = get_enhanced_ydl_opts({'extract_flat': 'in_playlist', 'lazy_playlist': True})
         
-        base_opts = get_ydl_opts_with_time_range(base_opts, request.time_range, request.precise_cut)
+        def enumerate_new(url, opts):
+            return _enumerate_new_entries_blocking(url, opts, format_key, request.stop_at_known,
+                                                  request.max_new_videos or performance.playlist_default_videos)
         
-        await download_with_fallback(request.url, base_opts)
+        result = await _run_with_cookie_health(enumerate_new, request.url, opts)
+        control.check()
+        lock = sync_locks.setdefault(result["archive"].path.name, asyncio.Lock())
+        waited = lock.locked()
+        await lock.acquire()
+        held_lock = lock
+        if waited:
+            # another sync of this playlist ran meanwhile, walk again against the archive it saved
+            result = await _run_with_cookie_health(enumerate_new, request.url, opts)
+            control.check()
+        archive = result["archive"]
+        playlist_title = sanitize_filename(result["playlist_title"]) or "playlist"
         
-        # More robust file detection - check for files with the expected base name
-        base_name = final_filename.replace('.%(ext)s', '')
-        possible_files = []
+        # the folder is fixed on first sync so a renamed playlist keeps filling the same place
+        if not archive.data.get("directory"):
+            safe_id = re.sub(r'[^\w-]', '_', archive.playlist_id)
+            archive.data["directory"] = f"sync_{playlist_title}_{safe_id}"[:150]
+        sync_dir = get_downloads_directory() / archive.data["directory"]
+        loop = asyncio.get_event_loop()
+        await loop.run_in_executor(None, lambda: sync_dir.mkdir(parents=True, exist_ok=True))
         
-        # Look for files with the exact base name and common extensions
-        for ext in ['m4a', 'mp3', 'webm', 'ogg', 'wav', 'aac']:
-            pattern = f"{base_name}.{ext}"
-            matches = list(get_downloads_directory().glob(pattern))
-            possible_files.extend(matches)
+        transcode_codec = request.target_codec if not request.video_format_id else None
+        downloaded, failed, transcode_jobs = [], [], []
         
-        # If no exact matches, fall back to generic search (most recent file)
-        if not possible_files:
-            downloads_dir = get_downloads_directory()
-            all_files = list(downloads_dir.glob("*.m4a")) + list(downloads_dir.glob("*.mp3")) + list(downloads_dir.glob("*.webm")) + list(downloads_dir.glob("*.ogg"))
-            if all_files:
-                # Get the most recently created file
-                possible_files = [max(all_files, key=lambda x: x.stat().st_mtime)]
+        await disk_admission.reserve(
+            sync_id,
+            estimate_batch_peak(result["retries"] + result["entries"], request.video_format_id,
+                                transcode_codec, zipped=False),
+            sync_dir
+        )
         
-        if not possible_files:
-            raise HTTPException(status_code=500, detail="Download failed - no audio files found in directory")
+        # oldest first so an interrupted sync leaves a contiguous archive behind,
+        # earlier failures are older than anything the walk found
+        new_entries = result["entries"]
+        if is_newest_first_url(request.url):
+            new_entries = list(reversed(new_entries))
         
-        # Use the most recent file if multiple matches
-        actual_file = max(possible_files, key=lambda x: x.stat().st_mtime)
+        for entry in result["retries"] + new_entries:
+            control.check()
+            video_id = entry['id']
+            video_title = sanitize_filename(entry.get('title') or video_id)
+            safe_video_title = re.sub(r'[^\w\s-]', '', video_title)[:100]
+            output_filename = f"{safe_video_title}_{video_id}"
+            try:
+                files = await download_entry_to_dir(
+                    video_id, output_filename, sync_dir,
+                    request.video_format_id, request.audio_format_id,
+                    newest_fallback=False
+                )
+                if not files:
+                    archive.mark_failed(entry, format_key, "no file downloaded")
+                    failed.append(f"{video_id}: {video_title}")
+                elif transcode_codec:
+                    transcode_jobs.append((entry, video_title, asyncio.ensure_future(transcode_audio_async(files[0], transcode_codec))))
+                else:
+                    archive.add(video_id, format_key, files[0].name)
+                    downloaded.append(files[0].name)
+            except Exception as e:
+                if control.cancelled:
+                    remove_partial_files(sync_dir, output_filename)
+                    raise
+                archive.mark_failed(entry, format_key, str(e))
+                failed.append(f"{video_id}: {str(e)}")
         
-        # ensure file is completely written before getting size
-        try:
-            actual_file_size = actual_file.stat().st_size
-            if actual_file_size == 0:
-                raise HTTPException(status_code=500, detail="Download failed - file is empty")
-        except OSError as e:
-            raise HTTPException(status_code=500, detail=f"Download failed - cannot access file: {str(e)}")
+        for entry, video_title, job in transcode_jobs:
+            try:
+                output = await job
+                archive.add(entry['id'], format_key, output.name)
+                downloaded.append(output.name)
+            except Exception as e:
+                archive.mark_failed(entry, format_key, f"conversion failed: {str(e)}")
+                failed.append(f"{entry['id']}: conversion failed: {str(e)}")
+        control.check()
         
-        active_downloads.pop(download_id, None)
+        end_download(sync_id)
+        disk_admission.release(sync_id)
+        await loop.run_in_executor(executor, archive.save)
         
-        return JSONResponse({
+        return {
             "success": True,
-            "filename": actual_file.name,
-            "file_path": str(actual_file),
-            "file_size": actual_file_size,
-            "download_id": download_id
-        })
+            "playlist_id": archive.playlist_id,
+            "playlist_title": playlist_title,
+            "directory": str(sync_dir),
+            "examined": result["examined"],
+            "stopped_early": result["stopped_early"],
+            "new_videos": len(result["entries"]),
+            "retried": len(result["retries"]),
+            "downloaded": downloaded,
+            "failed": failed,
+            "pending": len(archive.pending(format_key)),
+            "incomplete": archive.has_gap(format_key),
+            "archived_total": len(archive.known_ids(format_key))
+        }
         
+    except HTTPException:
+        end_download(sync_id)
+        disk_admission.release(sync_id)
+        raise
     except Exception as e:
-        active_downloads.pop(download_id, None)
-        raise HTTPException(status_code=500, detail=f"Audio download failed: {str(e)}")
+        end_download(sync_id)
+        disk_admission.release(sync_id)
+        if control.cancelled:
+            # videos finished before the cancel stay recorded so the next sync skips them
+            if archive is not None:
+                loop = asyncio.get_event_loop()
+                await loop.run_in_executor(executor, archive.save)
+            raise HTTPException(status_code=CANCELLED_STATUS_CODE, detail="Sync cancelled")
+        if isinstance(e, InsufficientDiskSpace):
+            raise HTTPException(status_code=INSUFFICIENT_STORAGE_STATUS_CODE, detail=str(e))
+        raise HTTPException(status_code=500, detail=f"Playlist sync failed: {str(e)}")
+    finally:
+        if held_lock is not None:
+            held_lock.release()
 
-# PLAYLIST ENDPOINTS
-@app.post("/api/playlist/info", response_model=PlaylistInfoResponse)
-async def get_playlist_info(request: PlaylistInfoRequest):
-    """Get playlist information with video list"""
-    try:
-        # Extract playlist info
-        info = await extract_playlist_info_with_fallback(
-            request.url, 
-            request.max_videos, 
-            request.include_formats
+# JOB QUEUE
+# with --queue the api process only enqueues downloads and waits on the result, `server.py --worker`
+# processes claim and run them. workers on other hosts point CLIPLY_JOB_DB at the same file on a
+# shared volume and should share the download folder too, since results carry the worker's file path
+JOB_QUEUE_DB = Path(os.environ.get("CLIPLY_JOB_DB") or get_settings_directory() / "jobs.sqlite3")
+JOB_QUEUE_MODE = os.environ.get("CLIPLY_JOB_QUEUE", "").lower() in ("1", "true", "yes")
+JOB_WORKER_CONCURRENCY = 2  # jobs one worker process runs at a time
+JOB_HEARTBEAT_INTERVAL = 10  # seconds
+JOB_STALE_AFTER = 60  # a running job without a heartbeat this long goes back to the queue
+JOB_MAX_ATTEMPTS = 3
+JOB_POLL_INTERVAL = 0.5
+JOB_PROGRESS_INTERVAL = 1.0  # min seconds between progress writes per job
+JOB_RETENTION = 24 * 3600  # finished jobs are pruned after this
+
+# set by the worker around a job so download_with_fallback can attach a progress hook
+job_progress_hook = contextvars.ContextVar("job_progress_hook", default=None)
+
+class JobQueue:
+    """sqlite-backed job queue shared by the api process and download workers"""
+    def __init__(self, path: Path):
+        self.path = path
+        self._initialized = False
+        self._init_lock = threading.Lock()
+    
+    def _connect(self) -> sqlite3.Connection:
+        # a short-lived connection per call keeps this safe across threads and processes;
+        # the default rollback journal (not WAL) also works from a network share
+        conn = sqlite3.connect(str(self.path), timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        if not self._initialized:
+            with self._init_lock:
+                if not self._initialized:
+                    conn.execute("""
+                        CREATE TABLE IF NOT EXISTS jobs (
+                            id TEXT PRIMARY KEY,
+                            kind TEXT NOT NULL,
+                            payload TEXT NOT NULL,
+                            status TEXT NOT NULL DEFAULT 'queued',
+                            worker TEXT,
+                            attempts INTEGER NOT NULL DEFAULT 0,
+                            progress TEXT,
+                            result TEXT,
+                            error TEXT,
+                            status_code INTEGER,
+                            created REAL NOT NULL,
+                            claimed REAL,
+                            heartbeat REAL,
+                            finished REAL,
+                            cancel_requested INTEGER NOT NULL DEFAULT 0
+                        )""")
+                    columns = [row["name"] for row in conn.execute("PRAGMA table_info(jobs)")]
+                    if "cancel_requested" not in columns:
+                        conn.execute("ALTER TABLE jobs ADD COLUMN cancel_requested INTEGER NOT NULL DEFAULT 0")
+                    conn.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created)")
+                    self._initialized = True
+        return conn
+    
+    def enqueue(self, kind: str, payload: dict) -> str:
+        job_id = str(uuid.uuid4())
+        conn = self._connect()
+        try:
+            conn.execute(
+                "INSERT INTO jobs (id, kind, payload, created) VALUES (?, ?, ?, ?)",
+                (job_id, kind, json.dumps(payload), time.time())
+            )
+        finally:
+            conn.close()
+        return job_id
+    
+    def claim(self, worker_id: str) -> Optional[dict]:
+        """take the oldest queued job, recovering jobs whose worker stopped heartbeating"""
+        now = time.time()
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                stale = now - JOB_STALE_AFTER
+                conn.execute(
+                    "UPDATE jobs SET status = 'cancelled', error = 'Download cancelled', status_code = ?, finished = ? "
+                    "WHERE status = 'running' AND heartbeat < ? AND cancel_requested = 1",
+                    (CANCELLED_STATUS_CODE, now, stale)
+                )
+                conn.execute(
+                    "UPDATE jobs SET status = 'failed', error = 'worker stopped responding', status_code = 500, finished = ? "
+                    "WHERE status = 'running' AND heartbeat < ? AND attempts >= ?",
+                    (now, stale, JOB_MAX_ATTEMPTS)
+                )
+                conn.execute(
+                    "UPDATE jobs SET status = 'queued', worker = NULL WHERE status = 'running' AND heartbeat < ?",
+                    (stale,)
+                )
+                row = conn.execute(
+                    "SELECT id FROM jobs WHERE status = 'queued' ORDER BY created LIMIT 1"
+                ).fetchone()
+                if row is None:
+                    conn.execute("COMMIT")
+                    return None
+                conn.execute(
+                    "UPDATE jobs SET status = 'running', worker = ?, attempts = attempts + 1, claimed = ?, heartbeat = ? WHERE id = ?",
+                    (worker_id, now, now, row["id"])
+                )
+                job = dict(conn.execute("SELECT * FROM jobs WHERE id = ?", (row["id"],)).fetchone())
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        finally:
+            conn.close()
+        job["payload"] = json.loads(job["payload"])
+        return job
+    
+    def _update_owned(self, sql: str, params: tuple):
+        # every worker write is scoped to worker = ? so a job recovered by someone else isn't clobbered
+        conn = self._connect()
+        try:
+            conn.execute(sql, params)
+        finally:
+            conn.close()
+    
+    def heartbeat(self, job_ids: List[str], worker_id: str):
+        if not job_ids:
+            return
+        placeholders = ",".join("?" * len(job_ids))
+        self._update_owned(
+            f"UPDATE jobs SET heartbeat = ? WHERE status = 'running' AND worker = ? AND id IN ({placeholders})",
+            (time.time(), worker_id, *job_ids)
         )
-        
-        # Get playlist metadata
-        playlist_title = info.get('title', 'Unknown Playlist')
-        playlist_id = info.get('id', '')
-        uploader = info.get('uploader', info.get('channel', 'Unknown'))
-        total_videos = info.get('playlist_count', 0)
-        entries = info.get('entries', [])
-        
-        # Process video entries
-        videos = process_playlist_entries(entries, request.include_formats)
-        
-        return PlaylistInfoResponse(
-            playlist_title=playlist_title,
-            playlist_id=playlist_id,
-            uploader=uploader,
-            total_videos=total_videos,
-            extracted_videos=len(videos),
-            videos=videos
+    
+    def report_progress(self, job_id: str, worker_id: str, progress: dict):
+        self._update_owned(
+            "UPDATE jobs SET progress = ?, heartbeat = ? WHERE id = ? AND status = 'running' AND worker = ?",
+            (json.dumps(progress), time.time(), job_id, worker_id)
         )
-        
+    
+    def complete(self, job_id: str, worker_id: str, result: dict):
+        self._update_owned(
+            "UPDATE jobs SET status = 'done', result = ?, finished = ? WHERE id = ? AND status = 'running' AND worker = ?",
+            (json.dumps(result), time.time(), job_id, worker_id)
+        )
+    
+    def fail(self, job_id: str, worker_id: str, error: str, status_code: int = 500):
+        status = 'cancelled' if status_code == CANCELLED_STATUS_CODE else 'failed'
+        self._update_owned(
+            "UPDATE jobs SET status = ?, error = ?, status_code = ?, finished = ? WHERE id = ? AND status = 'running' AND worker = ?",
+            (status, error, status_code, time.time(), job_id, worker_id)
+        )
+    
+    def cancel(self, job_id: str) -> Optional[str]:
+        """drop a queued job or flag a running one for its worker, returns the resulting status"""
+        conn = self._connect()
+        try:
+            cursor = conn.execute(
+                "UPDATE jobs SET status = 'cancelled', error = 'Download cancelled', status_code = ?, finished = ? "
+                "WHERE id = ? AND status = 'queued'",
+                (CANCELLED_STATUS_CODE, time.time(), job_id)
+            )
+            if cursor.rowcount:
+                return "cancelled"
+            cursor = conn.execute(
+                "UPDATE jobs SET cancel_requested = 1 WHERE id = ? AND status = 'running'", (job_id,)
+            )
+            if cursor.rowcount:
+                return "cancelling"
+            row = conn.execute("SELECT status FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            return row["status"] if row else None
+        finally:
+            conn.close()
+    
+    def cancel_requests(self, worker_id: str) -> List[str]:
+        conn = self._connect()
+        try:
+            return [row["id"] for row in conn.execute(
+                "SELECT id FROM jobs WHERE status = 'running' AND worker = ? AND cancel_requested = 1", (worker_id,)
+            )]
+        finally:
+            conn.close()
+    
+    def requeue(self, job_id: str, worker_id: str):
+        """hand a job back untouched, used when a worker shuts down mid-job"""
+        self._update_owned(
+            "UPDATE jobs SET status = 'queued', worker = NULL, attempts = attempts - 1 WHERE id = ? AND status = 'running' AND worker = ?",
+            (job_id, worker_id)
+        )
+    
+    def get(self, job_id: str) -> Optional[dict]:
+        conn = self._connect()
+        try:
+            row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        finally:
+            conn.close()
+        if row is None:
+            return None
+        job = dict(row)
+        job.pop("payload")
+        for key in ("progress", "result"):
+            job[key] = json.loads(job[key]) if job[key] else None
+        return job
+    
+    def prune(self, max_age: float = JOB_RETENTION) -> int:
+        conn = self._connect()
+        try:
+            cursor = conn.execute(
+                "DELETE FROM jobs WHERE status IN ('done', 'failed', 'cancelled') AND finished < ?",
+                (time.time() - max_age,)
+            )
+            return cursor.rowcount
+        finally:
+            conn.close()
+    
+    def stats(self) -> dict:
+        conn = self._connect()
+        try:
+            counts = dict(conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+            workers = [row[0] for row in conn.execute(
+                "SELECT DISTINCT worker FROM jobs WHERE status = 'running' AND heartbeat >= ?",
+                (time.time() - JOB_STALE_AFTER,)
+            )]
+        finally:
+            conn.close()
+        return {
+            "enabled": JOB_QUEUE_MODE,
+            "database": str(self.path),
+            "queued": counts.get("queued", 0),
+            "running": counts.get("running", 0),
+            "done": counts.get("done", 0),
+            "failed": counts.get("failed", 0),
+            "cancelled": counts.get("cancelled", 0),
+            "busy_workers": workers,
+        }
+
+job_queue = JobQueue(JOB_QUEUE_DB)
+
+# job kind -> (request model, handler); handlers run in the worker exactly as they would in-process
+JOB_HANDLERS = {
+    "combined": (CombinedDownloadRequest, download_combined_video_audio),
+    "audio": (AudioDownloadRequest, download_audio_only),
+    "sync": (PlaylistSyncRequest, sync_playlist),
+}
+
+async def run_queued_job(kind: str, request: BaseModel, http_request: Optional[Request] = None):
+    """enqueue a download and wait for a worker to finish it, answering like the in-process handler"""
+    loop = asyncio.get_event_loop()
+    job_id = await loop.run_in_executor(executor, job_queue.enqueue, kind, request.model_dump())
+    active_downloads[job_id] = {
+        "type": kind,
+        "url": getattr(request, "url", None),
+        "started": time.time(),
+        "status": "queued"
+    }
+    watcher = None
+    if http_request is not None:
+        watcher = asyncio.ensure_future(watch_client_disconnect(
+            http_request, lambda: loop.run_in_executor(executor, job_queue.cancel, job_id)
+        ))
+    try:
+        while True:
+            job = await loop.run_in_executor(executor, job_queue.get, job_id)
+            if job is None:
+                raise HTTPException(status_code=500, detail="Job disappeared from the queue")
+            active_downloads[job_id]["status"] = job["status"]
+            if job["status"] == "done":
+                return JSONResponse(job["result"])
+            if job["status"] in ("failed", "cancelled"):
+                raise HTTPException(status_code=job["status_code"] or 500, detail=job["error"])
+            await asyncio.sleep(JOB_POLL_INTERVAL)
+    finally:
+        if watcher is not None:
+            watcher.cancel()
+        active_downloads.pop(job_id, None)
+
+def make_progress_reporter(job_id: str, worker_id: str):
+    """yt-dlp progress hook that writes throttled progress for a job back to the queue"""
+    last_write = [0.0]
+    
+    def hook(d):
+        now = time.time()
+        finished = d.get('status') == 'finished'
+        if not finished and now - last_write[0] < JOB_PROGRESS_INTERVAL:
+            return
+        last_write[0] = now
+        total = d.get('total_bytes') or d.get('total_bytes_estimate')
+        downloaded = d.get('downloaded_bytes') or 0
+        progress = {
+            "status": d.get('status'),
+            "filename": os.path.basename(d.get('filename') or ''),
+            "downloaded_bytes": downloaded,
+            "total_bytes": total,
+            "percent": round(downloaded / total * 100, 1) if total else None,
+            "speed": d.get('speed'),
+            "eta": d.get('eta'),
+        }
+        try:
+            job_queue.report_progress(job_id, worker_id, progress)
+        except sqlite3.Error as e:
+            print(f"failed to report progress for job {job_id}: {e}")
+    
+    return hook
+
+async def run_claimed_job(job: dict, worker_id: str, control: DownloadControl):
+    loop = asyncio.get_event_loop()
+    job_id = job["id"]
+    try:
+        model, handler = JOB_HANDLERS[job["kind"]]
+        request = model(**job["payload"])
+        token = job_progress_hook.set(make_progress_reporter(job_id, worker_id))
+        # the handler adopts this control, so a cancel request reaches its yt-dlp and ffmpeg runs
+        control_token = current_download.set(control)
+        try:
+            response = await handler(request)
+        finally:
+            current_download.reset(control_token)
+            job_progress_hook.reset(token)
+        result = json.loads(response.body) if isinstance(response, JSONResponse) else response
+        await loop.run_in_executor(None, job_queue.complete, job_id, worker_id, result)
+        print(f"job {job_id} ({job['kind']}) done")
+    except asyncio.CancelledError:
+        await asyncio.shield(loop.run_in_executor(None, job_queue.requeue, job_id, worker_id))
+        raise
+    except HTTPException as e:
+        await loop.run_in_executor(None, job_queue.fail, job_id, worker_id, str(e.detail), e.status_code)
+        print(f"job {job_id} ({job['kind']}) failed: {e.detail}")
     except Exception as e:
-        raise HTTPException(status_code=400, detail=f"Failed to get playlist info: {str(e)}")
+        # a payload that no longer validates is the caller's fault, anything else is ours
+        status_code = 400 if isinstance(e, (ValueError, KeyError)) else 500
+        await loop.run_in_executor(None, job_queue.fail, job_id, worker_id, str(e), status_code)
+        print(f"job {job_id} ({job['kind']}) failed: {e}")
 
-@app.post("/api/playlist/download")
-async def download_playlist_videos(request: PlaylistDownloadRequest, background_tasks: BackgroundTasks):
-    """Download selected videos from playlist"""
+async def run_worker(concurrency: int = JOB_WORKER_CONCURRENCY):
+    """claim and run queued jobs until interrupted"""
+    worker_id = f"{socket.gethostname()}:{os.getpid()}"
+    loop = asyncio.get_event_loop()
+    print(f"worker {worker_id} serving {job_queue.path} with {concurrency} slot(s)")
+    
+    cookie_manager.ensure_cookie_file()
+    cookie_watch_task = asyncio.create_task(cookie_manager.watch())
+    loop.run_in_executor(executor, ydl_pool.warm, get_enhanced_ydl_opts())
+    warmup_task = asyncio.create_task(warm_player_js_cache())
+    # queue calls go to the default executor so they never wait behind a download in ours
+    await loop.run_in_executor(None, job_queue.prune)
+    
+    running = {}
+    controls = {}
+    last_heartbeat = time.time()
+    last_cancel_check = time.time()
     try:
-        download_id = str(uuid.uuid4())
-        
-        # First, get playlist info to validate selected videos
-        playlist_info = await extract_playlist_info_with_fallback(request.url, max_videos=100)
-        entries = playlist_info.get('entries', [])
-        
-        if not entries:
-            raise HTTPException(status_code=400, detail="No videos found in playlist")
-        
-        max_index = len(entries) - 1
-        invalid_indices = [i for i in request.selected_videos if i > max_index or i < 0]
-        if invalid_indices:
-            raise HTTPException(
-                status_code=400, 
-                detail=f"Invalid video indices: {invalid_indices}. Playlist has {len(entries)} videos (indices 0-{max_index})"
-            )
+        while True:
+            for job_id in [job_id for job_id, task in running.items() if task.done()]:
+                running.pop(job_id)
+                controls.pop(job_id)
+            
+            claimed = None
+            if len(running) < concurrency:
+                try:
+                    claimed = await loop.run_in_executor(None, job_queue.claim, worker_id)
+                except sqlite3.Error as e:
+                    print(f"failed to claim job: {e}")
+                if claimed is not None:
+                    print(f"job {claimed['id']} ({claimed['kind']}) claimed, attempt {claimed['attempts']}")
+                    controls[claimed["id"]] = DownloadControl()
+                    running[claimed["id"]] = asyncio.create_task(
+                        run_claimed_job(claimed, worker_id, controls[claimed["id"]]))
+            
+            if running and time.time() - last_cancel_check >= DISCONNECT_POLL_INTERVAL:
+                last_cancel_check = time.time()
+                try:
+                    for job_id in await loop.run_in_executor(None, job_queue.cancel_requests, worker_id):
+                        if job_id in controls and not controls[job_id].cancelled:
+                            print(f"job {job_id} cancel requested")
+                            controls[job_id].cancel()
+                except sqlite3.Error as e:
+                    print(f"failed to check for cancelled jobs: {e}")
+            
+            if time.time() - last_heartbeat >= JOB_HEARTBEAT_INTERVAL:
+                last_heartbeat = time.time()
+                try:
+                    await loop.run_in_executor(None, job_queue.heartbeat, list(running), worker_id)
+                except sqlite3.Error as e:
+                    print(f"failed to send heartbeat: {e}")
+            
+            # keep claiming without a pause while there is both work and a free slot
+            if claimed is None or len(running) >= concurrency:
+                await asyncio.sleep(JOB_POLL_INTERVAL)
+    finally:
+        warmup_task.cancel()
+        cookie_watch_task.cancel()
+        for task in running.values():
+            task.cancel()
+        await asyncio.gather(*running.values(), return_exceptions=True)
+        executor.shutdown(wait=False, cancel_futures=True)
+        transcode_executor.shutdown(wait=False, cancel_futures=True)
+        ydl_pool.close()
+        cookie_manager.save_jars()
+
+class JobSubmitRequest(BaseModel):
+    kind: str
+    request: dict
+    
+    @field_validator('kind')
+    @classmethod
+    def validate_kind(cls, v):
+        if v not in JOB_HANDLERS:
+            raise ValueError(f"kind must be one of: {', '.join(JOB_HANDLERS)}")
+        return v
+
+@app.post("/api/jobs")
+async def submit_job(request: JobSubmitRequest):
+    """enqueue a download for the workers and return right away"""
+    if not JOB_QUEUE_MODE:
+        raise HTTPException(status_code=409, detail="Job queue is disabled, start the server with --queue")
+    model, _ = JOB_HANDLERS[request.kind]
+    try:
+        payload = model(**request.request)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    loop = asyncio.get_event_loop()
+    job_id = await loop.run_in_executor(executor, job_queue.enqueue, request.kind, payload.model_dump())
+    return {"job_id": job_id, "status": "queued"}
+
+@app.delete("/api/jobs/{download_id}")
+async def cancel_download(download_id: str):
+    """cancel a running download (its download_id) or a queued job (its job_id)"""
+    entry = active_downloads.get(download_id)
+    control = entry.get("control") if entry else None
+    if control is not None:
+        control.cancel()
+        return {"download_id": download_id, "status": "cancelling"}
+    
+    if JOB_QUEUE_MODE:
+        loop = asyncio.get_event_loop()
+        status = await loop.run_in_executor(executor, job_queue.cancel, download_id)
+        if status is not None:
+            return {"download_id": download_id, "status": status}
+    raise HTTPException(status_code=404, detail="No running download with this id")
+
+@app.get("/api/jobs/{job_id}")
+async def get_job(job_id: str):
+    """status, progress and result of a queued job"""
+    loop = asyncio.get_event_loop()
+    job = await loop.run_in_executor(executor, job_queue.get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+# FILE SERVING
+FILE_CHUNK_SIZE = 256 * 1024
+GROWING_FILE_WAIT = 15  # seconds a reader ahead of an in-progress download waits for new bytes
+GROWING_FILE_POLL = 0.25
+
+def track_download_progress(download_id: str, directory: Path, base_name: str):
+    """progress hook recording which file a download is writing, for progressive playback.
+    the output prefix is recorded up front, ffmpeg-driven downloads (time ranges) only report once done"""
+    entry = active_downloads.get(download_id)
+    if entry is not None:
+        entry["output"] = (str(directory), base_name)
+    
+    def hook(d):
+        entry = active_downloads.get(download_id)
+        if entry is None:
+            return
+        entry["file"] = d.get('tmpfilename') or d.get('filename')
+        entry["downloaded_bytes"] = d.get('downloaded_bytes')
+        # only an exact size can be promised in Content-Length/Content-Range
+        entry["total_bytes"] = d.get('total_bytes')
+    return hook
+
+def find_download_file(entry: dict) -> Optional[Path]:
+    """file a running download is writing: the one its progress hook named, else the newest
+    file under its output prefix (range .part, component stream, uncut source or merge output)"""
+    if entry.get("file"):
+        return Path(entry["file"])
+    if not entry.get("output"):
+        return None
+    directory, base_name = entry["output"]
+    newest = None
+    try:
+        for path in Path(directory).iterdir():
+            if not path.name.startswith(f"{base_name}.") or path.name.endswith('.ytdl'):
+                continue
+            try:
+                mtime = path.stat().st_mtime
+            except OSError:
+                continue
+            if newest is None or mtime > newest[0]:
+                newest = (mtime, path)
+    except OSError:
+        return None
+    return newest[1] if newest else None
+
+BYTE_RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+def parse_byte_range(header: Optional[str], size: Optional[int]) -> Optional[tuple]:
+    """single 'bytes=' range -> (start, end or None), None means serve everything.
+    multi-range and malformed headers are ignored as rfc 9110 allows; raises ValueError if unsatisfiable"""
+    match = BYTE_RANGE_RE.match(header.strip()) if header else None
+    if not match or not any(match.groups()):
+        return None
+    start_str, end_str = match.groups()
+    if not start_str:
+        # suffix range, the last n bytes
+        if size is None:
+            return None
+        suffix = int(end_str)
+        if suffix == 0 or size == 0:
+            raise ValueError("unsatisfiable suffix range")
+        return max(size - suffix, 0), size - 1
+    start = int(start_str)
+    end = int(end_str) if end_str else None
+    if end is not None and end < start:
+        return None
+    if size is not None:
+        if start >= size:
+            raise ValueError("range starts past the end of the file")
+        end = size - 1 if end is None else min(end, size - 1)
+    return start, end
+
+def file_etag(st: os.stat_result) -> str:
+    return f'"{st.st_mtime_ns:x}-{st.st_size:x}"'
+
+def _read_chunk(path: Path, offset: int, size: int) -> bytes:
+    # opened per chunk so a growing .part is never held open while yt-dlp renames it (windows)
+    with open(path, "rb") as f:
+        f.seek(offset)
+        return f.read(size)
+
+class FileRangeResponse(Response):
+    """sends `length` bytes of a file from `start`; zero-copy when the server supports the
+    asgi zerocopysend extension, otherwise chunked reads off the event loop.
+    with `growing` set the file is still being written and the body follows it as it grows"""
+    def __init__(self, path: Path, start: int, length: Optional[int], status_code: int = 200,
+                 headers: Optional[dict] = None, media_type: Optional[str] = None,
+                 growing: Optional[Callable[[], bool]] = None):
+        self.path = path
+        self.start = start
+        self.length = length  # None streams until a growing file is finished
+        self.status_code = status_code
+        self.media_type = media_type
+        self.growing = growing
+        self.background = None
+        # body is left unset so init_headers doesn't add a content-length of its own
+        self.init_headers(headers)
+    
+    async def __call__(self, scope, receive, send):
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        if scope.get("method") == "HEAD" or self.length == 0:
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+            return
         
-        batch_dir = get_downloads_directory() / f"playlist_{download_id}"
-        batch_dir.mkdir(exist_ok=True)
+        loop = asyncio.get_event_loop()
+        if self.growing is None and "http.response.zerocopysend" in (scope.get("extensions") or {}):
+            # the extension takes the file object itself and sends from it with sendfile
+            f = await loop.run_in_executor(None, open, self.path, "rb")
+            try:
+                await send({
+                    "type": "http.response.zerocopysend",
+                    "file": f,
+                    "offset": self.start,
+                    "count": self.length,
+                    "more_body": False
+                })
+            finally:
+                f.close()
+            return
         
-        downloaded_files = []
-        failed_downloads = []
+        offset = self.start
+        remaining = self.length
+        idle_since = time.time()
+        path = self.path
+        while remaining is None or remaining > 0:
+            want = FILE_CHUNK_SIZE if remaining is None else min(FILE_CHUNK_SIZE, remaining)
+            try:
+                # default executor, a read must not queue behind downloads in ours
+                chunk = await loop.run_in_executor(None, _read_chunk, path, offset, want)
+            except FileNotFoundError:
+                if self.growing is None or path.suffix != '.part':
+                    break
+                # yt-dlp renames name.ext.part to name.ext once the stream is complete
+                path = path.with_suffix('')
+                continue
+            if chunk:
+                await send({"type": "http.response.body", "body": chunk, "more_body": True})
+                offset += len(chunk)
+                if remaining is not None:
+                    remaining -= len(chunk)
+                idle_since = time.time()
+                continue
+            if (self.growing is None or time.time() - idle_since > GROWING_FILE_WAIT
+                    or not await loop.run_in_executor(None, self.growing)):
+                break
+            await asyncio.sleep(GROWING_FILE_POLL)
+        # a body cut short of its content-length makes the server drop the connection, which
+        # players treat as a retry point
+        await send({"type": "http.response.body", "body": b"", "more_body": False})
+
+def guess_media_type(path: Path) -> str:
+    name = path.name[:-5] if path.name.endswith('.part') else path.name
+    return mimetypes.guess_type(name)[0] or 'application/octet-stream'
+
+async def build_file_response(request: Request, path: Path) -> Response:
+    """conditional + range response for a finished file"""
+    try:
+        st = await asyncio.get_event_loop().run_in_executor(None, path.stat)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="File not found")
+    etag = file_etag(st)
+    last_modified = formatdate(st.st_mtime, usegmt=True)
+    headers = {
+        "accept-ranges": "bytes",
+        "etag": etag,
+        "last-modified": last_modified,
+    }
+    
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and (if_none_match.strip() == "*" or etag in [tag.strip() for tag in if_none_match.split(",")]):
+        return Response(status_code=304, headers=headers)
+    
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    if range_header and if_range and if_range.strip() not in (etag, last_modified):
+        # the client's copy is stale, it gets the whole current file instead of a mismatched piece
+        range_header = None
+    
+    try:
+        byte_range = parse_byte_range(range_header, st.st_size)
+    except ValueError:
+        return Response(status_code=416, headers={**headers, "content-range": f"bytes */{st.st_size}"})
+    
+    if byte_range is None:
+        headers["content-length"] = str(st.st_size)
+        return FileRangeResponse(path, 0, st.st_size, 200, headers, guess_media_type(path))
+    
+    start, end = byte_range
+    headers["content-length"] = str(end - start + 1)
+    headers["content-range"] = f"bytes {start}-{end}/{st.st_size}"
+    return FileRangeResponse(path, start, end - start + 1, 206, headers, guess_media_type(path))
+
+def _written_size(path: Path) -> int:
+    try:
+        return path.stat().st_size
+    except FileNotFoundError:
+        return 0
+
+async def build_growing_file_response(request: Request, download_id: str, path: Path) -> Response:
+    """range response for a file an active download is still writing"""
+    def growing() -> bool:
+        return download_id in active_downloads and path.exists()
+    
+    entry = active_downloads.get(download_id) or {}
+    total = entry.get("total_bytes")
+    headers = {
+        "accept-ranges": "bytes",
+        # contents change until the download finishes, so nothing may be cached or revalidated
+        "cache-control": "no-store",
+    }
+    media_type = guess_media_type(path)
+    
+    try:
+        byte_range = parse_byte_range(request.headers.get("range"), total)
+    except ValueError:
+        return Response(status_code=416, headers={**headers, "content-range": f"bytes */{total}"})
+    
+    if byte_range is None:
+        if total:
+            headers["content-length"] = str(total)
+        return FileRangeResponse(path, 0, total, 200, headers, media_type, growing=growing)
+    
+    start, end = byte_range
+    if total is None:
+        # without a known size only bytes already on disk can be promised
+        loop = asyncio.get_event_loop()
+        deadline = time.time() + GROWING_FILE_WAIT
+        written = await loop.run_in_executor(None, _written_size, path)
+        while written <= start and time.time() < deadline and await loop.run_in_executor(None, growing):
+            await asyncio.sleep(GROWING_FILE_POLL)
+            written = await loop.run_in_executor(None, _written_size, path)
+        if written <= start:
+            return Response(status_code=416, headers={**headers, "content-range": "bytes */*"})
+        end = written - 1 if end is None else min(end, written - 1)
+    headers["content-length"] = str(end - start + 1)
+    headers["content-range"] = f"bytes {start}-{end}/{total or '*'}"
+    return FileRangeResponse(path, start, end - start + 1, 206, headers, media_type, growing=growing)
+
+def resolve_download_file(file_path: str) -> Path:
+    """map a client supplied path to a file inside the downloads folder"""
+    downloads_dir = get_downloads_directory().resolve()
+    candidate = Path(file_path)
+    if not candidate.is_absolute():
+        candidate = downloads_dir / candidate
+    try:
+        candidate = candidate.resolve(strict=True)
+    except (OSError, RuntimeError):
+        raise HTTPException(status_code=404, detail="File not found")
+    if not candidate.is_relative_to(downloads_dir) or not candidate.is_file():
+        raise HTTPException(status_code=404, detail="File not found")
+    return candidate
+
+@app.api_route("/api/files", methods=["GET", "HEAD"])
+async def serve_file(request: Request, path: str):
+    """serve a finished download (the `file_path` from a download response) with range support"""
+    loop = asyncio.get_event_loop()
+    file_path = await loop.run_in_executor(None, resolve_download_file, path)
+    return await build_file_response(request, file_path)
+
+@app.get("/api/downloads/active")
+async def list_active_downloads():
+    """running downloads and the file each is writing, for progressive playback"""
+    return [
+        {
+            "download_id": download_id,
+            "type": entry.get("type"),
+            "url": entry.get("url"),
+            "started": entry.get("started"),
+            "status": entry.get("status", "running"),
+            "file": os.path.basename(entry["file"]) if entry.get("file") else None,
+            "downloaded_bytes": entry.get("downloaded_bytes"),
+            "total_bytes": entry.get("total_bytes"),
+            "stream_url": f"/api/downloads/{download_id}/stream" if entry.get("file") or entry.get("output") else None,
+        }
+        for download_id, entry in list(active_downloads.items())
+    ]
+
+@app.api_route("/api/downloads/{download_id}/stream", methods=["GET", "HEAD"])
+async def stream_active_download(request: Request, download_id: str):
+    """serve the file a running download is writing, following it as it grows"""
+    entry = active_downloads.get(download_id)
+    loop = asyncio.get_event_loop()
+    path = await loop.run_in_executor(None, find_download_file, entry) if entry else None
+    if path is None:
+        raise HTTPException(status_code=404, detail="No file is being written for this download")
+    if not await loop.run_in_executor(None, path.exists):
+        # the stream finished between progress reports and lost its .part suffix
+        finished = path.with_suffix('') if path.suffix == '.part' else path
+        return await build_file_response(request, finished)
+    return await build_growing_file_response(request, download_id, path)
+
+# DERIVED MEDIA CACHE
+# storyboards and waveforms are derived from a stream once and then served from disk:
+# one folder per video id (optionally one subfolder per level), built in a scratch folder
+# and renamed into place, least recently used videos pruned past the configured count
+YOUTUBE_VIDEO_ID_RE = re.compile(r'(?:v=|youtu\.be/|embed/|/v/|shorts/)([\w-]{11})')
+VIDEO_ID_RE = re.compile(r'[\w-]+')
+DERIVED_MEDIA_MAX_AGE = 604800  # seconds, a file never changes under its url
+
+def youtube_video_id(url: str) -> Optional[str]:
+    match = YOUTUBE_VIDEO_ID_RE.search(url)
+    return match.group(1) if match else None
+
+def ffmpeg_input_args(fmt: dict) -> List[str]:
+    """-i for a format's url, with the http headers youtube expects"""
+    header_lines = "".join(f"{key}: {value}\r\n" for key, value in (fmt.get('http_headers') or {}).items())
+    args = ['-headers', header_lines] if header_lines else []
+    return [*args, '-i', fmt['url']]
+
+class DerivedMediaCache:
+    def __init__(self, name: str, max_videos: Callable[[], int]):
+        self.name = name
+        self.max_videos = max_videos
+        self.locks = {}
+    
+    @property
+    def root(self) -> Path:
+        return Path.home() / APP_CONFIG_DIR / self.name
+    
+    def target_dir(self, video_id: str, level: Optional[str] = None) -> Path:
+        video_dir = self.root / video_id
+        return video_dir / level if level else video_dir
+    
+    def load_index(self, video_id: str, level: Optional[str] = None) -> Optional[dict]:
+        try:
+            index = json.loads((self.target_dir(video_id, level) / "index.json").read_text())
+        except (OSError, ValueError):
+            return None
+        # touch so the lru prune keeps videos that are still being edited
+        os.utime(self.root / video_id)
+        return index
+    
+    def build(self, video_id: str, level: Optional[str], create: Callable[[Path], dict]) -> dict:
+        """create fills a scratch folder and returns its index, the folder then replaces the cached one"""
+        target_dir = self.target_dir(video_id, level)
+        target_dir.parent.mkdir(parents=True, exist_ok=True)
+        # scratch folders are dot-named so the prune never mistakes them for a video
+        work_dir = Path(tempfile.mkdtemp(prefix=f".{video_id}_", dir=self.root))
+        try:
+            index = create(work_dir)
+            (work_dir / "index.json").write_text(json.dumps(index))
+            shutil.rmtree(target_dir, ignore_errors=True)
+            work_dir.rename(target_dir)
+        except Exception:
+            shutil.rmtree(work_dir, ignore_errors=True)
+            raise
         
-        for video_index in request.selected_videos:
-            try:
-                entry = entries[video_index]
-                video_id = entry.get('id', '')
-                video_title = sanitize_filename(entry.get('title', f'video_{video_index}'))
-                video_url = f"https://www.youtube.com/watch?v={video_id}"
-                
-                if request.video_format_id:
-                    format_string = get_format_selector(request.video_format_id, request.audio_format_id)
-                    file_ext = "mp4"
-                else:
-                    format_string = get_audio_format_selector(request.audio_format_id)
-                    file_ext = "m4a"
-                
-                safe_video_title = re.sub(r'[^\w\s-]', '', video_title)[:100]
-                output_filename = f"{video_index:03d}_{safe_video_title}"
-                output_path = batch_dir / f"{output_filename}.%(ext)s"
-                
-                base_opts = {
-                    'outtmpl': str(output_path),
-                    'merge_output_format': file_ext,
-                    'restrictfilenames': True,
-                }
-                
-                # Only add format if not using yt-dlp default (auto)
-                if format_string is not None:
-                    base_opts['format'] = format_string
-                
-                await download_with_fallback(video_url, base_opts)
-                
-                downloaded_file = list(batch_dir.glob(f"{output_filename}.*"))
-                
-                if not downloaded_file:
-                    downloaded_file = list(batch_dir.glob(f"*{output_filename}*"))
-                
-                if not downloaded_file:
-                    downloaded_file = list(batch_dir.glob(f"*{video_id}*"))
-                
-                if not downloaded_file:
-                    all_files = list(batch_dir.glob("*"))
-                    if all_files:
-                        downloaded_file = [max(all_files, key=os.path.getctime)]
-                
-                if downloaded_file:
-                    downloaded_files.append(downloaded_file[0])
-                else:
-                    failed_downloads.append(f"Video {video_index}: {video_title}")
-                
-            except Exception as e:
-                failed_downloads.append(f"Video {video_index}: {str(e)}")
-                continue
+        try:
+            self.prune()
+        except OSError as e:
+            print(f"failed to prune {self.name} cache: {e}")
+        return index
+    
+    def prune(self):
+        videos = sorted((d for d in self.root.iterdir() if d.is_dir() and not d.name.startswith('.')),
+                        key=lambda d: d.stat().st_mtime, reverse=True)
+        for stale in videos[self.max_videos():]:
+            shutil.rmtree(stale, ignore_errors=True)
+    
+    async def get_or_build(self, url: str, level: Optional[str], create) -> dict:
+        """index for the video behind url; on a miss the video is extracted and
+        await create(info, video_id) builds it, once however many requests ask at the same time"""
+        loop = asyncio.get_event_loop()
+        video_id = youtube_video_id(url)
         
-        if not downloaded_files:
-            try:
-                batch_dir.rmdir()
-            except:
-                pass
-            raise HTTPException(status_code=500, detail="No videos were successfully downloaded")
+        # a cached entry answers without touching youtube at all
+        if video_id:
+            index = await loop.run_in_executor(None, self.load_index, video_id, level)
+            if index is not None:
+                return index
         
-        if len(downloaded_files) == 1:
-            file_path = downloaded_files[0]
-            playlist_title = sanitize_filename(playlist_info.get('title', 'playlist'))
-            
-            def cleanup():
-                try:
-                    file_path.unlink(missing_ok=True)
-                    batch_dir.rmdir()
-                except:
-                    pass
-            
-            background_tasks.add_task(cleanup)
-            
-            return FileResponse(
-                path=str(file_path),
-                filename=f"{playlist_title}_{file_path.name}",
-                media_type='application/octet-stream'
-            )
+        info = await extract_video_info_with_fallback(url)
+        video_id = re.sub(r'[^\w-]', '_', info.get('id') or video_id or '')
+        if not video_id:
+            raise HTTPException(status_code=400, detail="Could not determine the video id")
         
-        else:
-            playlist_title = sanitize_filename(playlist_info.get('title', 'playlist'))
-            archive_name = request.archive_name or f"{playlist_title}_videos"
-            zip_path = batch_dir.parent / f"{download_id}_{archive_name}.zip"
-            
-            with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
-                for file_path in downloaded_files:
-                    zipf.write(file_path, file_path.name)
-            
-            def cleanup():
-                try:
-                    for file_path in downloaded_files:
-                        file_path.unlink(missing_ok=True)
-                    batch_dir.rmdir()
-                    zip_path.unlink(missing_ok=True)
-                except:
-                    pass
-            
-            background_tasks.add_task(cleanup)
-            
-            return FileResponse(
-                path=str(zip_path),
-                filename=f"{archive_name}.zip",
-                media_type='application/zip'
+        # concurrent requests build once, the rest pick the result up from disk
+        lock_key = f"{video_id}/{level or ''}"
+        lock = self.locks.setdefault(lock_key, asyncio.Lock())
+        try:
+            async with lock:
+                index = await loop.run_in_executor(None, self.load_index, video_id, level)
+                if index is None:
+                    index = await create(info, video_id)
+        finally:
+            self.locks.pop(lock_key, None)
+        return index
+    
+    async def file_response(self, request: Request, video_id: str, level: Optional[str], filename: str) -> Response:
+        if not VIDEO_ID_RE.fullmatch(video_id):
+            raise HTTPException(status_code=404, detail="Not found")
+        path = self.target_dir(video_id, level) / filename
+        if not await asyncio.get_event_loop().run_in_executor(None, path.is_file):
+            raise HTTPException(status_code=404, detail="Not found")
+        response = await build_file_response(request, path)
+        # a rebuild replaces the whole folder, so a url's contents never change
+        response.headers["cache-control"] = f"public, max-age={DERIVED_MEDIA_MAX_AGE}"
+        return response
+
+async def build_from_stream(page_url: str, build: Callable[[dict], dict]) -> dict:
+    """run a blocking build that reads youtube media through the download lane of the upstream limiter,
+    with the cookie health bookkeeping and throttle retries of any other download"""
+    return await _run_with_cookie_health(lambda _url, opts: build(opts), page_url, get_enhanced_ydl_opts(),
+                                         lane="download")
+
+# STORYBOARDS
+STORYBOARD_DEFAULT_WIDTH = 160
+PROXY_STORYBOARD_TILES = 100  # frames sampled across the video when there is no youtube storyboard
+PROXY_STORYBOARD_GRID = 5  # columns and rows per proxy sheet
+
+storyboard_cache = DerivedMediaCache("storyboards", lambda: performance.storyboard_cache_max_videos)
+
+def pick_storyboard_format(info: dict, max_width: int) -> Optional[dict]:
+    """widest storyboard level that fits max_width, else the smallest one"""
+    boards = [f for f in info.get('formats') or []
+              if f.get('format_note') == 'storyboard' and f.get('fragments') and f.get('columns') and f.get('rows')]
+    if not boards:
+        return None
+    fitting = [f for f in boards if (f.get('width') or 0) <= max_width]
+    if fitting:
+        return max(fitting, key=lambda f: f.get('width') or 0)
+    return min(boards, key=lambda f: f.get('width') or 0)
+
+def pick_proxy_format(info: dict) -> Optional[dict]:
+    """lowest bitrate video-bearing format, decoded keyframe-only to sample preview frames"""
+    videos = [f for f in info.get('formats') or []
+              if f.get('vcodec') not in (None, 'none') and f.get('url')
+              and f.get('protocol') in ('https', 'http') and (f.get('height') or 0) >= 144]
+    if not videos:
+        return None
+    return min(videos, key=lambda f: (f.get('tbr') or float('inf'), f.get('height') or 0))
+
+def build_storyboard_index(video_id: str, level: str, source: str, duration: float, interval: float,
+                           tile_width: int, tile_height: int, columns: int, rows: int, sheet_tiles: List[int],
+                           sheet_dir: Path) -> dict:
+    per_sheet = columns * rows
+    sheets = []
+    for n, tiles in enumerate(sheet_tiles):
+        first = n * per_sheet
+        sheet_path = sheet_dir / f"sheet_{n:03d}.jpg"
+        sheets.append({
+            "index": n,
+            "url": f"/api/video/storyboard/{video_id}/{level}/{n}",
+            "bytes": sheet_path.stat().st_size,
+            "start": round(first * interval, 3),
+            # tile i of the sheet, left to right then top to bottom, starts at timestamps[i]
+            "timestamps": [round((first + i) * interval, 3) for i in range(tiles)],
+        })
+    return {
+        "video_id": video_id,
+        "source": source,
+        "duration": duration,
+        "interval": round(interval, 3),
+        "tile_width": tile_width,
+        "tile_height": tile_height,
+        "columns": columns,
+        "rows": rows,
+        "tile_count": sum(sheet_tiles),
+        "sheets": sheets,
+    }
+
+def _fetch_youtube_storyboard(fmt: dict, sheet_dir: Path, opts: dict) -> List[int]:
+    """download the storyboard's jpeg sheets, returns the tile count of each"""
+    per_sheet = fmt['columns'] * fmt['rows']
+    total_tiles = max(1, round(fmt['fps'] * sum(fragment['duration'] for fragment in fmt['fragments'])))
+    sheet_tiles = []
+    with ydl_pool.acquire(opts) as ydl:
+        for n, fragment in enumerate(fmt['fragments']):
+            data = ydl.urlopen(fragment['url']).read()
+            (sheet_dir / f"sheet_{n:03d}.jpg").write_bytes(data)
+            sheet_tiles.append(max(0, min(per_sheet, total_tiles - n * per_sheet)))
+    return sheet_tiles
+
+def _render_proxy_storyboard(fmt: dict, sheet_dir: Path, interval: float, tile_width: int) -> List[int]:
+    """sample one frame per interval from a low bitrate stream straight off the network, tiled by ffmpeg"""
+    grid = PROXY_STORYBOARD_GRID
+    _run_ffmpeg([
+        '-skip_frame', 'nokey', *ffmpeg_input_args(fmt), '-an', '-sn',
+        '-vf', f"fps=1/{interval},scale={tile_width}:-2,tile={grid}x{grid}",
+        '-q:v', '5', str(sheet_dir / 'sheet_%03d.jpg')
+    ])
+    sheets = sorted(sheet_dir.glob('sheet_*.jpg'))
+    if not sheets:
+        raise RuntimeError("ffmpeg produced no preview frames")
+    # ffmpeg numbers from 1, the index numbers from 0
+    for n, sheet in enumerate(sheets):
+        sheet.rename(sheet_dir / f"sheet_{n:03d}.jpg.tmp")
+    for sheet in sheet_dir.glob('sheet_*.jpg.tmp'):
+        sheet.rename(sheet.with_suffix(''))
+    return [grid * grid] * len(sheets)
+
+def _render_storyboard(info: dict, video_id: str, level: str, max_width: int, work_dir: Path, opts: dict) -> dict:
+    duration = float(info.get('duration') or 0)
+    fmt = pick_storyboard_format(info, max_width)
+    if fmt is not None:
+        try:
+            sheet_tiles = _fetch_youtube_storyboard(fmt, work_dir, opts)
+            return build_storyboard_index(
+                video_id, level, "storyboard", duration, 1 / fmt['fps'],
+                fmt['width'], fmt['height'], fmt['columns'], fmt['rows'], sheet_tiles, work_dir
             )
-        
+        except Exception as e:
+            print(f"storyboard fetch failed for {video_id}, falling back to proxy frames: {e}")
+            for leftover in work_dir.iterdir():
+                leftover.unlink()
+    
+    proxy = pick_proxy_format(info)
+    if proxy is None or not FFMPEG_PATH:
+        raise HTTPException(status_code=404, detail="No storyboard or preview stream available for this video")
+    tile_width = min(max_width, proxy.get('width') or max_width)
+    if proxy.get('width') and proxy.get('height'):
+        tile_height = round(tile_width * proxy['height'] / proxy['width'] / 2) * 2
+    else:
+        tile_height = round(tile_width * 9 / 16 / 2) * 2
+    interval = max(1.0, duration / PROXY_STORYBOARD_TILES)
+    sheet_tiles = _render_proxy_storyboard(proxy, work_dir, interval, tile_width)
+    # the last sheet only holds the frames left over
+    total_tiles = math.ceil(duration / interval)
+    per_sheet = PROXY_STORYBOARD_GRID * PROXY_STORYBOARD_GRID
+    sheet_tiles = [max(0, min(per_sheet, total_tiles - n * per_sheet)) for n in range(len(sheet_tiles))]
+    return build_storyboard_index(
+        video_id, level, "proxy", duration, interval, tile_width, tile_height,
+        PROXY_STORYBOARD_GRID, PROXY_STORYBOARD_GRID, sheet_tiles, work_dir
+    )
+
+class StoryboardRequest(BaseModel):
+    url: str
+    max_width: int = STORYBOARD_DEFAULT_WIDTH  # widest tile wanted, in pixels
+    
+    @field_validator('url')
+    @classmethod
+    def validate_url(cls, v):
+        return VideoInfoRequest.validate_youtube_url(v)
+    
+    @field_validator('max_width')
+    @classmethod
+    def validate_max_width(cls, v):
+        if v < 32 or v > 640:
+            raise ValueError('max_width must be between 32 and 640')
+        return v
+
+@app.post("/api/video/storyboard")
+async def get_video_storyboard(request: StoryboardRequest):
+    """tiled preview frames with a timestamp index, cached on disk by video id"""
+    level = f"w{request.max_width}"
+    
+    async def create(info: dict, video_id: str) -> dict:
+        if float(info.get('duration') or 0) <= 0:
+            raise HTTPException(status_code=400, detail="Storyboards need a video with a known duration")
+        return await build_from_stream(request.url, lambda opts: storyboard_cache.build(
+            video_id, level, lambda work_dir: _render_storyboard(info, video_id, level, request.max_width, work_dir, opts)
+        ))
+    
+    try:
+        return await storyboard_cache.get_or_build(request.url, level, create)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to build storyboard: {str(e)}")
+
+@app.get("/api/video/storyboard/{video_id}/{level}/{sheet}")
+async def get_storyboard_sheet(request: Request, video_id: str, level: str, sheet: int):
+    """one cached sprite sheet"""
+    if not re.fullmatch(r'w\d+', level) or sheet < 0:
+        raise HTTPException(status_code=404, detail="Storyboard not found")
+    return await storyboard_cache.file_response(request, video_id, level, f"sheet_{sheet:03d}.jpg")
+
+# WAVEFORMS
+# min/max peaks of a low bitrate audio stream, decoded mono at a low sample rate straight off
+# the network. level 0 holds WAVEFORM_PEAKS_PER_SECOND peaks per second, each further level
+# merges WAVEFORM_LEVEL_FACTOR peaks of the one before. stored per video id as raw int8 pairs
+WAVEFORM_SAMPLE_RATE = 8000
+WAVEFORM_PEAKS_PER_SECOND = 50
+WAVEFORM_LEVEL_FACTOR = 4
+WAVEFORM_MAX_LEVELS = 6
+WAVEFORM_MIN_PEAKS = 1000  # no coarser level once one fits in this many peaks
+WAVEFORM_READ_PEAKS = 1024  # peaks decoded per read from ffmpeg
+
+waveform_cache = DerivedMediaCache("waveforms", lambda: performance.waveform_cache_max_videos)
+
+def pick_waveform_format(info: dict) -> Optional[dict]:
+    """lowest bitrate http stream with audio, audio-only preferred"""
+    candidates = [f for f in info.get('formats') or []
+                  if f.get('acodec') not in (None, 'none') and f.get('url')
+                  and f.get('protocol') in ('https', 'http')]
+    if not candidates:
+        return None
+    return min(candidates, key=lambda f: (f.get('vcodec') not in (None, 'none'),
+                                          f.get('abr') or f.get('tbr') or float('inf')))
+
+def _decode_peaks(fmt: dict) -> tuple:
+    """level 0 as interleaved (min, max) int8 pairs plus the decoded sample count"""
+    samples_per_peak = WAVEFORM_SAMPLE_RATE // WAVEFORM_PEAKS_PER_SECOND
+    peak_bytes = samples_per_peak * 2
+    peaks = array('b')
+    total_samples = 0
+    
+    def add_peaks(data: bytes):
+        nonlocal total_samples
+        samples = array('h', data)
+        if sys.byteorder == 'big':
+            samples.byteswap()
+        total_samples += len(samples)
+        for start in range(0, len(samples), samples_per_peak):
+            chunk = samples[start:start + samples_per_peak]
+            peaks.append(min(chunk) >> 8)
+            peaks.append(max(chunk) >> 8)
+    
+    def read_pcm(stdout):
+        pending = b''
+        while True:
+            data = stdout.read(peak_bytes * WAVEFORM_READ_PEAKS)
+            if not data:
+                break
+            pending += data
+            # a trailing partial peak waits for the next read, only the last one stays short
+            whole = len(pending) - len(pending) % peak_bytes
+            add_peaks(pending[:whole])
+            pending = pending[whole:]
+        if len(pending) >= 2:
+            add_peaks(pending[:len(pending) - len(pending) % 2])
+    
+    _run_ffmpeg([*ffmpeg_input_args(fmt), '-vn', '-sn', '-ac', '1', '-ar', str(WAVEFORM_SAMPLE_RATE),
+                 '-f', 's16le', '-acodec', 'pcm_s16le', 'pipe:1'], read_stdout=read_pcm)
+    if not peaks:
+        raise RuntimeError("ffmpeg decoded no audio")
+    return peaks, total_samples
+
+def downsample_peaks(peaks: array, factor: int) -> array:
+    lows, highs = peaks[0::2], peaks[1::2]
+    merged = array('b')
+    for start in range(0, len(lows), factor):
+        merged.append(min(lows[start:start + factor]))
+        merged.append(max(highs[start:start + factor]))
+    return merged
+
+def _render_waveform(fmt: dict, video_id: str, work_dir: Path) -> dict:
+    peaks, total_samples = _decode_peaks(fmt)
+    levels = []
+    seconds_per_peak = 1 / WAVEFORM_PEAKS_PER_SECOND
+    for level in range(WAVEFORM_MAX_LEVELS):
+        if level:
+            peaks = downsample_peaks(peaks, WAVEFORM_LEVEL_FACTOR)
+            seconds_per_peak *= WAVEFORM_LEVEL_FACTOR
+        (work_dir / f"level_{level}.i8").write_bytes(peaks.tobytes())
+        levels.append({
+            "level": level,
+            "url": f"/api/audio/waveform/{video_id}/{level}",
+            "seconds_per_peak": round(seconds_per_peak, 6),
+            "peaks": len(peaks) // 2,
+            "bytes": len(peaks),
+        })
+        if len(peaks) // 2 <= WAVEFORM_MIN_PEAKS:
+            break
+    
+    return {
+        "video_id": video_id,
+        "format_id": fmt.get('format_id'),
+        "duration": round(total_samples / WAVEFORM_SAMPLE_RATE, 3),
+        # peak i of a level covers [i, i+1) * seconds_per_peak, stored as signed min then max,
+        # full scale 127. byte ranges of a level file fetch just the window being shown
+        "encoding": "int8 min/max pairs",
+        "levels": levels,
+    }
+
+class WaveformRequest(BaseModel):
+    url: str
+    
+    @field_validator('url')
+    @classmethod
+    def validate_url(cls, v):
+        return VideoInfoRequest.validate_youtube_url(v)
+
+@app.post("/api/audio/waveform")
+async def get_audio_waveform(request: WaveformRequest):
+    """waveform peak levels for picking a time range, cached on disk by video id"""
+    async def create(info: dict, video_id: str) -> dict:
+        fmt = pick_waveform_format(info)
+        if fmt is None or not FFMPEG_PATH:
+            raise HTTPException(status_code=404, detail="No audio stream available for this video")
+        return await build_from_stream(request.url, lambda opts: waveform_cache.build(
+            video_id, None, lambda work_dir: _render_waveform(fmt, video_id, work_dir)
+        ))
+    
+    try:
+        return await waveform_cache.get_or_build(request.url, None, create)
+    except HTTPException:
+        raise
     except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to build waveform: {str(e)}")
+
+@app.get("/api/audio/waveform/{video_id}/{level}")
+async def get_waveform_level(request: Request, video_id: str, level: int):
+    """raw int8 min/max pairs of one zoom level, supports byte ranges"""
+    if level < 0:
+        raise HTTPException(status_code=404, detail="Waveform not found")
+    return await waveform_cache.file_response(request, video_id, None, f"level_{level}.i8")
+
+# SETTINGS ENDPOINTS
+def get_download_path_status() -> dict:
+    """resolve the download folder and test it's writable, touches disk so run it off the loop"""
+    current_path = get_downloads_directory()
+    
+    # Check if path exists and is writable
+    exists = current_path.exists()
+    writable = False
+    
+    if exists:
         try:
-            batch_dir = get_downloads_directory() / f"playlist_{download_id}"
-            if batch_dir.exists():
-                for file in batch_dir.glob("*"):
-                    file.unlink()
-                batch_dir.rmdir()
+            # Test write permissions
+            test_file = current_path / "cliply_test_write.tmp"
+            test_file.write_text("test")
+            test_file.unlink()
+            writable = True
         except:
-            pass
-        raise HTTPException(status_code=500, detail=f"Playlist download failed: {str(e)}")
+            writable = False
+    
+    return {
+        "path": str(current_path),
+        "exists": exists,
+        "writable": writable
+    }
 
-# SETTINGS ENDPOINTS
 @app.get("/api/settings/download-path", response_model=DownloadPathResponse)
 async def get_download_path():
     """get current download folder info"""
     try:
-        current_path = get_downloads_directory()
-        
-        # Check if path exists and is writable
-        exists = current_path.exists()
-        writable = False
-        
-        if exists:
-            try:
-                # Test write permissions
-                test_file = current_path / "cliply_test_write.tmp"
-                test_file.write_text("test")
-                test_file.unlink()
-                writable = True
-            except:
-                writable = False
-        
-        return DownloadPathResponse(
-            path=str(current_path),
-            exists=exists,
-            writable=writable
-        )
+        loop = asyncio.get_event_loop()
+        status = await loop.run_in_executor(executor, get_download_path_status)
+        return DownloadPathResponse(**status)
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"failed to get download path: {str(e)}")
@@ -1022,7 +4348,8 @@ async def get_download_path():
 async def set_download_path(request: DownloadPathRequest):
     """update download folder location"""
     try:
-        success = set_downloads_directory(request.path)
+        loop = asyncio.get_event_loop()
+        success = await loop.run_in_executor(executor, set_downloads_directory, request.path)
         
         if not success:
             raise HTTPException(
@@ -1031,24 +4358,11 @@ async def set_download_path(request: DownloadPathRequest):
             )
         
         # Return updated path info
-        current_path = get_downloads_directory()
-        exists = current_path.exists()
-        writable = False
-        
-        if exists:
-            try:
-                test_file = current_path / "cliply_test_write.tmp"
-                test_file.write_text("test")
-                test_file.unlink()
-                writable = True
-            except:
-                writable = False
+        status = await loop.run_in_executor(executor, get_download_path_status)
         
         return {
             "success": True,
-            "path": str(current_path),
-            "exists": exists,
-            "writable": writable
+            **status
         }
         
     except HTTPException:
@@ -1056,94 +4370,283 @@ async def set_download_path(request: DownloadPathRequest):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"failed to set download path: {str(e)}")
 
-@app.get("/api/health/ffmpeg", include_in_schema=False)
-async def check_ffmpeg_health():
-    if not FFMPEG_PATH: 
-        return {
-            "available": False,
-            "error": "ffmpeg not found"
-        }
-    
+def apply_performance_settings(updated: PerformanceSettings):
+    """swap in new tunables, work already running keeps the threads and limits it started with"""
+    global performance, executor, transcode_executor
+    previous = performance
+    performance = updated
+    # queued and running calls still finish on the retired pool's threads, new calls go to the new pool
+    if updated.executor_workers != previous.executor_workers:
+        retired, executor = executor, ThreadPoolExecutor(max_workers=updated.executor_workers)
+        retired.shutdown(wait=False)
+    if updated.transcode_workers != previous.transcode_workers:
+        retired, transcode_executor = transcode_executor, ThreadPoolExecutor(
+            max_workers=updated.transcode_workers, thread_name_prefix="transcode")
+        retired.shutdown(wait=False)
+    player_js_cache.code.resize(updated.player_code_cache_size)
+    player_js_cache.results.resize(updated.player_result_cache_size)
+    # a lower ceiling applies to new requests, slots already handed out drain on their own
+    for limiter in upstream.limiters.values():
+        limiter.limit = min(limiter.limit, float(updated.upstream_max_concurrency))
+    # yt-dlp options (retries, fragment concurrency) are read per call, pooled instances with the
+    # old ones age out of the pool like any other unused key
+
+@app.get("/api/settings/performance", response_model=PerformanceSettings)
+async def get_performance_settings():
+    """current performance tunables"""
+    return performance
+
+@app.patch("/api/settings/performance", response_model=PerformanceSettings)
+async def update_performance_settings(changes: dict):
+    """change some tunables at runtime, in-flight jobs are not interrupted"""
     try:
-        result = subprocess.run([FFMPEG_PATH, '-version'], 
-                              capture_output=True, 
-                              timeout=10,
-                              text=True)
+        unknown = sorted(set(changes) - set(PerformanceSettings.model_fields))
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"unknown performance settings: {', '.join(unknown)}")
+        try:
+            updated = PerformanceSettings(**{**performance.model_dump(), **changes})
+        except ValidationError as e:
+            raise HTTPException(status_code=400, detail=[error['msg'] for error in e.errors()])
         
-        if result.returncode == 0:
-            version_line = result.stdout.split('\n')[0] if result.stdout else "Unknown version"
-            return {
-                "available": True,
-                "path": FFMPEG_PATH,
-                "version": version_line,
-                "test_passed": True
-            }
+        loop = asyncio.get_event_loop()
+        if not await loop.run_in_executor(executor, save_performance_settings, updated):
+            raise HTTPException(status_code=500, detail="failed to save performance settings")
+        apply_performance_settings(updated)
+        return performance
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"failed to update performance settings: {str(e)}")
+
+# METRICS ENDPOINTS
+class LoopDebugRequest(BaseModel):
+    enabled: bool
+    stall_threshold_ms: Optional[float] = None
+
+@app.get("/api/metrics/loop", include_in_schema=False)
+async def get_loop_metrics():
+    """event loop lag stats, plus captured stall stacks when debug mode is on"""
+    return loop_monitor.snapshot()
+
+@app.get("/api/metrics/ydl-pool", include_in_schema=False)
+async def get_ydl_pool_metrics():
+    """reuse stats for pooled YoutubeDL instances"""
+    return ydl_pool.stats()
+
+@app.get("/api/metrics/player-cache", include_in_schema=False)
+async def get_player_cache_metrics():
+    """player js / challenge cache hit rate"""
+    return player_js_cache.stats()
+
+@app.get("/api/metrics/jobs", include_in_schema=False)
+async def get_job_metrics():
+    loop = asyncio.get_event_loop()
+    return await loop.run_in_executor(executor, job_queue.stats)
+
+@app.get("/api/metrics/upstream", include_in_schema=False)
+async def get_upstream_metrics():
+    return upstream.stats()
+
+@app.get("/api/metrics/disk", include_in_schema=False)
+async def get_disk_metrics():
+    """free space on the downloads volume and what running jobs have reserved"""
+    return disk_admission.stats(get_downloads_directory())
+
+@app.post("/api/metrics/loop/debug", include_in_schema=False)
+async def set_loop_debug(request: LoopDebugRequest):
+    """toggle stack capture for loop stalls"""
+    loop_monitor.debug = request.enabled
+    if request.stall_threshold_ms is not None and request.stall_threshold_ms > 0:
+        loop_monitor.stall_threshold_ms = request.stall_threshold_ms
+    if not request.enabled:
+        loop_monitor.stalls.clear()
+    return loop_monitor.snapshot()
+
+# BINARY HEALTH PROBES
+BINARY_PROBE_TTL = 300  # seconds before a cached probe result is re-run
+BINARY_PROBE_TIMEOUT = 10
+
+def _binary_mtime(path: str) -> Optional[int]:
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+def _run_version_blocking(path: str, version_flag: str) -> tuple[int, str, str]:
+    result = subprocess.run([path, version_flag],
+                          capture_output=True,
+                          timeout=BINARY_PROBE_TIMEOUT,
+                          text=True)
+    return result.returncode, result.stdout or "", result.stderr or ""
+
+async def _run_version_async(path: str, version_flag: str) -> tuple[int, str, str]:
+    """run `<binary> <version_flag>` without blocking the event loop"""
+    try:
+        proc = await asyncio.create_subprocess_exec(
+            path, version_flag,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE
+        )
+    except NotImplementedError:
+        # selector loops on windows can't spawn subprocesses, use a worker thread instead
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(executor, _run_version_blocking, path, version_flag)
+    
+    try:
+        stdout, stderr = await asyncio.wait_for(proc.communicate(), timeout=BINARY_PROBE_TIMEOUT)
+    except asyncio.TimeoutError:
+        proc.kill()
+        await proc.wait()
+        raise subprocess.TimeoutExpired([path, version_flag], BINARY_PROBE_TIMEOUT)
+    
+    return (
+        proc.returncode,
+        stdout.decode('utf-8', errors='replace'),
+        stderr.decode('utf-8', errors='replace')
+    )
+
+class BinaryProbeCache:
+    """cache `--version` probes of bundled binaries, re-run on expiry or when the binary changes on disk"""
+    def __init__(self, ttl: float = BINARY_PROBE_TTL):
+        self.ttl = ttl
+        self._results = {}
+        self._locks = {}
+    
+    def invalidate(self, name: Optional[str] = None):
+        if name is None:
+            self._results.clear()
         else:
+            self._results.pop(name, None)
+    
+    def _get_fresh(self, name: str, path: str) -> Optional[dict]:
+        cached = self._results.get(name)
+        if not cached:
+            return None
+        if time.monotonic() - cached["probed_at"] > self.ttl:
+            return None
+        if cached["path"] != path or cached["mtime"] != _binary_mtime(path):
+            return None
+        return cached["result"]
+    
+    async def probe(self, name: str, path: Optional[str], version_flag: str) -> dict:
+        if not path:
             return {
                 "available": False,
-                "path": FFMPEG_PATH,
-                "error": f"ffmpeg test failed with code {result.returncode}",
-                "stderr": result.stderr[:500] if result.stderr else ""
+                "error": f"{name} not found"
             }
+        
+        result = self._get_fresh(name, path)
+        if result is not None:
+            return result
+        
+        # one probe per binary at a time, concurrent callers wait for its result
+        lock = self._locks.setdefault(name, asyncio.Lock())
+        async with lock:
+            result = self._get_fresh(name, path)
+            if result is not None:
+                return result
             
-    except subprocess.TimeoutExpired:
-        return {
-            "available": False,
-            "path": FFMPEG_PATH,
-            "error": "ffmpeg test timeout"
-        }
-    except Exception as e:
-        return {
-            "available": False,
-            "path": FFMPEG_PATH,
-            "error": f"ffmpeg test error: {str(e)}"
-        }
-
-@app.get("/api/health/deno", include_in_schema=False)
-async def check_deno_health():
-    """Check if Deno runtime is available and working"""
-    if not DENO_PATH: 
-        return {
-            "available": False,
-            "error": "deno not found"
-        }
+            mtime = _binary_mtime(path)
+            result = await self._run_probe(name, path, version_flag)
+            self._results[name] = {
+                "path": path,
+                "mtime": mtime,
+                "probed_at": time.monotonic(),
+                "result": result
+            }
+            return result
     
-    try:
-        result = subprocess.run([DENO_PATH, '--version'], 
-                              capture_output=True, 
-                              timeout=10,
-                              text=True)
+    async def _run_probe(self, name: str, path: str, version_flag: str) -> dict:
+        try:
+            returncode, stdout, stderr = await _run_version_async(path, version_flag)
+            
+            if returncode == 0:
+                version_line = stdout.split('\n')[0] if stdout else "Unknown version"
+                return {
+                    "available": True,
+                    "path": path,
+                    "version": version_line,
+                    "test_passed": True
+                }
+            else:
+                return {
+                    "available": False,
+                    "path": path,
+                    "error": f"{name} test failed with code {returncode}",
+                    "stderr": stderr[:500] if stderr else ""
+                }
         
-        if result.returncode == 0:
-            version_line = result.stdout.split('\n')[0] if result.stdout else "Unknown version"
+        except subprocess.TimeoutExpired:
             return {
-                "available": True,
-                "path": DENO_PATH,
-                "version": version_line,
-                "test_passed": True
+                "available": False,
+                "path": path,
+                "error": f"{name} test timeout"
             }
-        else:
+        except Exception as e:
             return {
                 "available": False,
-                "path": DENO_PATH,
-                "error": f"deno test failed with code {result.returncode}",
-                "stderr": result.stderr[:500] if result.stderr else ""
+                "path": path,
+                "error": f"{name} test error: {str(e)}"
             }
-            
-    except subprocess.TimeoutExpired:
-        return {
-            "available": False,
-            "path": DENO_PATH,
-            "error": "deno test timeout"
-        }
-    except Exception as e:
-        return {
-            "available": False,
-            "path": DENO_PATH,
-            "error": f"deno test error: {str(e)}"
-        }
+
+binary_probes = BinaryProbeCache()
+
+@app.get("/api/health/ffmpeg", include_in_schema=False)
+async def check_ffmpeg_health():
+    return await binary_probes.probe("ffmpeg", FFMPEG_PATH, '-version')
+
+@app.get("/api/health/deno", include_in_schema=False)
+async def check_deno_health():
+    """Check if Deno runtime is available and working"""
+    return await binary_probes.probe("deno", DENO_PATH, '--version')
+
+@app.get("/api/health/cookies", include_in_schema=False)
+async def check_cookie_health():
+    """cookie pool identities and their bot-detection health"""
+    loop = asyncio.get_event_loop()
+    identities = await loop.run_in_executor(executor, cookie_manager.status)
+    return {
+        "identities": identities,
+        "usable": sum(1 for identity in identities if identity["cookies"] > 0),
+        "healthy": sum(1 for identity in identities if identity["cookies"] > 0 and identity["healthy"])
+    }
+
+@app.get("/api/health/capabilities", include_in_schema=False)
+async def check_capabilities():
+    """combined binary health, served from the probe cache after the first call"""
+    ffmpeg, deno = await asyncio.gather(
+        binary_probes.probe("ffmpeg", FFMPEG_PATH, '-version'),
+        binary_probes.probe("deno", DENO_PATH, '--version')
+    )
+    return {
+        "ffmpeg": ffmpeg,
+        "deno": deno,
+        "cookies": cookie_manager.has_valid_cookies(),
+        "can_merge": ffmpeg["available"],
+        "can_cut": ffmpeg["available"],
+        "js_runtime": deno["available"]
+    }
 
 if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Cliply API server")
+    parser.add_argument("--queue", action="store_true", help="hand downloads to worker processes instead of running them here")
+    parser.add_argument("--worker", action="store_true", help="run as a download worker claiming jobs from the shared queue")
+    parser.add_argument("--concurrency", type=int, default=JOB_WORKER_CONCURRENCY, help="jobs a worker runs at once")
+    args, _ = parser.parse_known_args()
+    
+    if args.worker:
+        # the worker runs the handlers itself, so they must not enqueue again
+        JOB_QUEUE_MODE = False
+        try:
+            asyncio.run(run_worker(max(1, args.concurrency)))
+        except KeyboardInterrupt:
+            pass
+        sys.exit(0)
+    
+    if args.queue:
+        JOB_QUEUE_MODE = True
     import uvicorn
     uvicorn.run(
         app,